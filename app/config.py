@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -5,7 +6,66 @@ class Settings(BaseSettings):
     smtp_port: int
     smtp_user: str
     smtp_password: str
+    smtp_start_tls: bool = True
+    smtp_pool_size: int = 4
+    smtp_idle_timeout: float = 60.0
+    smtp_health_check_after: float = 10.0
+    smtp_max_messages_per_connection: int = 100
+    smtp_rate_per_second: float = 5.0
+    smtp_rate_burst: int = 10
+    email_concurrency: int = 8
+    document_concurrency: int = 20
     firebase_collection: str
+    # Projetos Firebase por tenant (nome -> ficheiro da service account), inicializados no primeiro uso
+    firebase_tenants: dict[str, str] = {
+        "default": "serviceAccountKey.json",
+        "aemc": "serviceAccountKeyAemc.json",
+    }
+
+    # "listener" usa on_snapshot e "push" recebe eventos em /events; em ambos o polling é só reconciliação.
+    # "poll" usa apenas o polling, ao ritmo de cada pipeline
+    ingestion_mode: Literal["listener", "push", "poll"] = "listener"
+    # Sem token o endpoint /events recusa todos os pedidos
+    events_token: str = ""
+    event_queue_size: int = 10000
+    fallback_poll_minutes: int = 30
+    # Intervalo de polling adaptativo: encurta com páginas cheias e recua com ticks vazios
+    adaptive_polling: bool = True
+    poll_floor_seconds: float = 10.0
+    poll_ceiling_seconds: float = 900.0
+    poll_jitter: float = 0.1
+    listener_health_check_seconds: int = 30
+    admin_cache_ttl: int = 300
+    # Com leader election desativada, vários workers dividem o trabalho por shards
+    worker_id: str = ""
+    claim_lease_seconds: int = 300
+    shard_count: int = 1
+    shard_index: int = 0
+    leader_election_enabled: bool = True
+    leader_lease_ttl: float = 10.0
+    leader_heartbeat_seconds: float = 3.0
+    write_flush_interval: float = 0.5
+    outbox_path: str = "outbox.sqlite3"
+    outbox_flush_interval: float = 0.01
+    outbox_retention_seconds: int = 7 * 24 * 3600
+    retry_max_attempts: int = 5
+    retry_base_delay: float = 30.0
+    retry_max_delay: float = 3600.0
+    # Scans paginados a partir do último documento processado (high-water mark). As queries
+    # (campo pendente == valor, ordenadas por created_field e id) precisam de índices compostos,
+    # definidos em firestore/default.indexes.json e firestore/aemc.indexes.json; sem eles cada tick
+    # falha com FAILED_PRECONDITION. Se firebase_collection ou os created_field mudarem, ajustar os
+    # ficheiros e publicá-los em cada projeto com `firebase deploy --only firestore:indexes`
+    poll_page_size: int = 200
+    registration_created_field: str = "createdAt"
+    aemc_message_created_field: str = "createdAt"
+    aemc_notification_created_field: str = "createdAt"
+    # Logging estruturado: "json" ou "text"; amostragem das linhas por destinatário
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_recipient_sample_rate: float = 1.0
+    # Com PROMETHEUS_MULTIPROC_DIR, cada worker publica o tamanho das suas filas a este ritmo
+    metrics_refresh_seconds: float = 5.0
 
     class Config:
         env_file = ".env"
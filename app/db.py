@@ -1,7 +1,6 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+from app.tenants import DEFAULT_TENANT, tenants
 
-# Inicializar o Firebase
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
\ No newline at end of file
+# Clientes do projeto principal, criados apenas no primeiro uso (ver app.tenants)
+db = tenants[DEFAULT_TENANT].lazy("db")
+# Cliente assíncrono para queries e escritas; o síncrono fica para os watch streams (on_snapshot)
+db_async = tenants[DEFAULT_TENANT].lazy("db_async")
@@ -1,8 +1,7 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from app.tenants import tenants
 
-# Inicializar o Firebase AEMC com um nome específico
-cred = credentials.Certificate("serviceAccountKeyAemc.json")
-aemc_app = firebase_admin.initialize_app(cred, name='aemc-app')
-dbAemc = firestore.client(app=aemc_app)
-authAemc = auth.Client(app=aemc_app)
\ No newline at end of file
+# Clientes do projeto AEMC, criados apenas no primeiro uso (ver app.tenants)
+dbAemc = tenants["aemc"].lazy("db")
+# Cliente assíncrono para queries e escritas; o síncrono fica para os watch streams (on_snapshot)
+dbAemcAsync = tenants["aemc"].lazy("db_async")
+authAemc = tenants["aemc"].lazy("auth")
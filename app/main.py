@@ -1,16 +1,83 @@
-from fastapi import FastAPI
-from app.scheduler import start_scheduler
+import asyncio
+import hmac
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Response
+from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST
+from app.config import settings
+from app.logging_config import setup_logging, stop_logging
+from app.metrics import render_metrics
+from app.scheduler import run_states, start_scheduler, stop_scheduler
+from app.utils.firebase_utils import PIPELINES, events
 
-app = FastAPI()
+setup_logging(settings.log_level, settings.log_format, settings.log_recipient_sample_rate)
 
-# Iniciar o scheduler
-scheduler = start_scheduler()
 
-@app.on_event("shutdown")
-def shutdown_event():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Iniciar o scheduler no event loop da aplicação
+    scheduler = await start_scheduler()
+    yield
     # Parar o scheduler ao encerrar o app
-    scheduler.shutdown()
+    await stop_scheduler(scheduler)
+    stop_logging()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class PushedDocuments(BaseModel):
+    """Documents announced by a trigger: bare ids and/or payloads carrying an `id`."""
+    ids: list[str] = []
+    documents: list[dict] = []
+
 
 @app.get("/")
 async def root():
     return {"message": "FastAPI Firebase Scheduler is running"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/pipelines")
+async def pipelines():
+    """Run-state of each pipeline's poll job on this worker."""
+    return {name: state.snapshot() for name, state in run_states.items()}
+
+
+@app.post("/events/{pipeline}", status_code=202)
+async def push_events(pipeline: str, pushed: PushedDocuments, authorization: str = Header(default="")):
+    """Queue documents written to `pipeline` for immediate processing.
+
+    Refused unless `events_token` is configured. Any worker accepts the
+    push: only the ids are used, and each document is read again from
+    Firestore and goes through the same claim as a polled one, so replays
+    and duplicate deliveries are harmless. A 503 asks the trigger to retry
+    later because the queue is full.
+    """
+    if not settings.events_token:
+        raise HTTPException(status_code=403, detail="Push ingestion is disabled: EVENTS_TOKEN is not set")
+    # Comparar bytes: compare_digest rejeita str com caracteres não ASCII
+    expected = f"Bearer {settings.events_token}".encode()
+    if not hmac.compare_digest(authorization.encode(), expected):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if pipeline not in PIPELINES:
+        raise HTTPException(status_code=404, detail=f"Unknown pipeline {pipeline}")
+
+    doc_ids = list(pushed.ids)
+    for document in pushed.documents:
+        if not isinstance(document.get("id"), str):
+            raise HTTPException(status_code=422, detail="Every document needs a string id")
+        doc_ids.append(document["id"])
+    doc_ids = list(dict.fromkeys(doc_ids))
+
+    if not events.is_running:
+        raise HTTPException(status_code=503, detail="Event queue is not running")
+    try:
+        queued = events.submit(pipeline, doc_ids)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Event queue is full")
+    return {"queued": queued}
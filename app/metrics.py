@@ -0,0 +1,69 @@
+import os
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Com gunicorn e vários workers as métricas vão para PROMETHEUS_MULTIPROC_DIR (ver gunicorn.conf.py)
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# Buckets pensados para chamadas de rede (ms até dezenas de segundos)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Da criação do documento até o email ser aceite: segundos até horas
+END_TO_END_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600)
+
+DOCS_FETCHED = Counter(
+    "nilia_docs_fetched_total", "Documents read by the pipelines", ["pipeline", "source"])
+EMAILS_SENT = Counter(
+    "nilia_emails_sent_total", "Emails accepted by the SMTP server", ["pipeline"])
+EMAILS_FAILED = Counter(
+    "nilia_emails_failed_total", "Email sends that failed", ["pipeline"])
+
+QUERY_LATENCY = Histogram(
+    "nilia_query_seconds", "Time spent waiting on Firestore query streams per page",
+    ["pipeline"], buckets=LATENCY_BUCKETS)
+RENDER_LATENCY = Histogram(
+    "nilia_render_seconds", "Email body render time", ["pipeline"], buckets=LATENCY_BUCKETS)
+SMTP_CONNECT_LATENCY = Histogram(
+    "nilia_smtp_connect_seconds", "SMTP connect, STARTTLS and login time", buckets=LATENCY_BUCKETS)
+SMTP_SEND_LATENCY = Histogram(
+    "nilia_smtp_send_seconds", "SMTP send time for one message", buckets=LATENCY_BUCKETS)
+END_TO_END_LATENCY = Histogram(
+    "nilia_end_to_end_seconds", "Time from document creation to email accepted",
+    ["pipeline"], buckets=END_TO_END_BUCKETS)
+
+QUEUE_DEPTH = Gauge(
+    "nilia_queue_depth", "Items waiting in internal queues", ["queue"], multiprocess_mode="livesum")
+
+TICK_DURATION = Histogram(
+    "nilia_tick_seconds", "Duration of scheduler ticks", ["job"], buckets=END_TO_END_BUCKETS)
+TICK_OVERRUNS = Counter(
+    "nilia_tick_overruns_total", "Ticks that took longer than their interval", ["job"])
+TICKS_SKIPPED = Counter(
+    "nilia_ticks_skipped_total", "Ticks missed or skipped by the scheduler", ["job"])
+TICKS_COALESCED = Counter(
+    "nilia_ticks_coalesced_total", "Ticks folded into the sweep that was still running", ["job"])
+TICK_RUNNING = Gauge(
+    "nilia_tick_running", "Whether a sweep of the job is in progress", ["job"], multiprocess_mode="livemax")
+POLL_INTERVAL = Gauge(
+    "nilia_poll_interval_seconds", "Current adaptive poll interval of each job", ["job"],
+    multiprocess_mode="livemostrecent")
+
+# Funções que devolvem o tamanho de cada fila; set_function não funciona entre processos
+_queue_depths = {}
+
+
+def track_queue_depth(queue, depth):
+    _queue_depths[queue] = depth
+
+
+def refresh_queue_depths():
+    for queue, depth in _queue_depths.items():
+        QUEUE_DEPTH.labels(queue).set(depth())
+
+
+def render_metrics():
+    """Exposition of every worker's metrics in multiprocess mode, else of this process."""
+    refresh_queue_depths()
+    if not MULTIPROCESS:
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
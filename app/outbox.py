@@ -0,0 +1,247 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    pipeline TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    acked INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    history TEXT NOT NULL DEFAULT '[]',
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_unacked ON outbox (acked, pipeline, doc_id);
+"""
+
+
+def outbox_key(pipeline, doc_id, recipient):
+    """Idempotency key of one email: a (doc_id, recipient) pair per pipeline."""
+    return f"{pipeline}:{doc_id}:{recipient}"
+
+
+class Outbox:
+    """Durable SQLite outbox of rendered emails.
+
+    A document's emails are written here before they are sent and before the
+    Firestore ack, and the rows are marked sent/failed and then acked as the
+    pipeline moves on. On startup the rows that were never acked are
+    replayed. Statements are queued and committed together every
+    `flush_interval` seconds on a single SQLite thread, so concurrent
+    documents share one fsync instead of paying one each.
+
+    A row's body is only kept while it may still be sent: once the row is
+    sent (or dead) and its document acked, the body is blanked, since some
+    emails carry credentials. Only the metadata stays until `purge()`.
+    """
+
+    def __init__(self, path, flush_interval=0.01):
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="outbox")
+        self._conn = None
+        self._pending = []
+        self._timer = None
+        self._flushing = set()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        # Corpos apagados são sobrescritos com zeros no ficheiro
+        conn.execute("PRAGMA secure_delete=ON")
+        conn.executescript(SCHEMA)
+        # Ficheiros criados antes da coluna history
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+        if "history" not in columns:
+            conn.execute("ALTER TABLE outbox ADD COLUMN history TEXT NOT NULL DEFAULT '[]'")
+        return conn
+
+    async def open(self):
+        if self._conn is None:
+            loop = asyncio.get_running_loop()
+            self._conn = await loop.run_in_executor(self._executor, self._open)
+
+    async def _submit(self, operation):
+        """Run `operation(conn)` inside the next group commit and return its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((operation, future))
+        if self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._start_flush)
+        return await future
+
+    def _start_flush(self):
+        self._timer = None
+        operations, self._pending = self._pending, []
+        if not operations:
+            return
+        task = asyncio.get_running_loop().create_task(self._flush(operations))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    def _commit(self, operations):
+        results = []
+        self._conn.execute("BEGIN")
+        try:
+            for operation, _ in operations:
+                try:
+                    results.append((True, operation(self._conn)))
+                except sqlite3.Error as e:
+                    results.append((False, e))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _flush(self, operations):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._commit, operations)
+        except Exception as e:
+            results = [(False, e)] * len(operations)
+        for (_, future), (ok, value) in zip(operations, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def enqueue(self, pipeline, doc_id, subject, body, recipients):
+        """Store the rendered email for each recipient; returns {recipient: status}.
+
+        Recipients already in the outbox keep their row, so a document seen
+        again after a crash does not resend emails that already went out.
+        """
+        now = time.time()
+
+        def operation(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (key, pipeline, doc_id, recipient, subject, body, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(outbox_key(pipeline, doc_id, r), pipeline, doc_id, r, subject, body, now) for r in recipients],
+            )
+            # Um documento reprocessado volta a ter linhas por confirmar
+            conn.execute("UPDATE outbox SET acked = 0 WHERE pipeline = ? AND doc_id = ?", (pipeline, doc_id))
+            rows = conn.execute(
+                "SELECT recipient, status FROM outbox WHERE pipeline = ? AND doc_id = ?", (pipeline, doc_id))
+            return dict(rows.fetchall())
+
+        return await self._submit(operation)
+
+    async def mark_results(self, pipeline, doc_id, results, errors=None):
+        """Record the outcome of each send: `results` maps recipient to success.
+
+        Failed rows count one more attempt and keep the error from `errors`,
+        also appended to the row's failure history.
+        """
+        now = time.time()
+        errors = errors or {}
+
+        def operation(conn):
+            conn.executemany(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, body = CASE WHEN acked = 1 THEN '' ELSE body END "
+                "WHERE key = ?",
+                [(now, outbox_key(pipeline, doc_id, r)) for r, ok in results.items() if ok],
+            )
+            for recipient in [r for r, ok in results.items() if not ok]:
+                key = outbox_key(pipeline, doc_id, recipient)
+                row = conn.execute("SELECT history FROM outbox WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                history = json.loads(row[0]) + [{"at": now, "error": errors.get(recipient)}]
+                conn.execute(
+                    "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ?, history = ? "
+                    "WHERE key = ?",
+                    (errors.get(recipient), json.dumps(history), key),
+                )
+
+        await self._submit(operation)
+
+    async def mark_dead(self, pipeline, doc_id, recipient):
+        def operation(conn):
+            conn.execute(
+                "UPDATE outbox SET status = 'dead', body = CASE WHEN acked = 1 THEN '' ELSE body END WHERE key = ?",
+                (outbox_key(pipeline, doc_id, recipient),))
+
+        await self._submit(operation)
+
+    async def statuses(self, pipeline, doc_id):
+        def operation(conn):
+            rows = conn.execute(
+                "SELECT recipient, status FROM outbox WHERE pipeline = ? AND doc_id = ?", (pipeline, doc_id))
+            return dict(rows.fetchall())
+
+        return await self._submit(operation)
+
+    async def failed(self):
+        """Failed sends of acked documents, waiting to be retried."""
+        def operation(conn):
+            rows = conn.execute(
+                "SELECT pipeline, doc_id, recipient, subject, body, attempts, history FROM outbox "
+                "WHERE status = 'failed' AND acked = 1 ORDER BY created_at")
+            return [
+                {"pipeline": pipeline, "doc_id": doc_id, "recipient": recipient, "subject": subject,
+                 "body": body, "attempts": attempts, "history": json.loads(history)}
+                for pipeline, doc_id, recipient, subject, body, attempts, history in rows
+            ]
+
+        return await self._submit(operation)
+
+    async def mark_acked(self, pipeline, doc_id):
+        def operation(conn):
+            conn.execute("UPDATE outbox SET acked = 1 WHERE pipeline = ? AND doc_id = ?", (pipeline, doc_id))
+            # Linhas que já não vão ser enviadas não precisam do corpo
+            conn.execute(
+                "UPDATE outbox SET body = '' WHERE pipeline = ? AND doc_id = ? AND status IN ('sent', 'dead')",
+                (pipeline, doc_id))
+
+        await self._submit(operation)
+
+    async def unacked(self):
+        """Documents whose Firestore ack was never recorded, with their rows."""
+        def operation(conn):
+            rows = conn.execute(
+                "SELECT pipeline, doc_id, recipient, subject, body, status FROM outbox "
+                "WHERE acked = 0 ORDER BY created_at")
+            documents = {}
+            for pipeline, doc_id, recipient, subject, body, status in rows:
+                documents.setdefault((pipeline, doc_id), []).append({
+                    "recipient": recipient, "subject": subject, "body": body, "status": status,
+                })
+            return documents
+
+        return await self._submit(operation)
+
+    async def purge(self, older_than):
+        """Drop acked rows created more than `older_than` seconds ago."""
+        cutoff = time.time() - older_than
+
+        def operation(conn):
+            return conn.execute(
+                "DELETE FROM outbox WHERE acked = 1 AND status != 'failed' AND created_at < ?", (cutoff,)).rowcount
+
+        return await self._submit(operation)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+        if self._conn is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self._conn.close)
+            self._conn = None
@@ -0,0 +1,101 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class RetryScheduler:
+    """Retry failed sends with jittered exponential backoff.
+
+    Items wait in a heap ordered by due time and a single task sleeps until
+    the earliest one, so nothing is re-polled. `send(item)` raises on
+    failure; after `max_attempts` failures the item, with its failure
+    history, is handed to `on_dead_letter(item)` instead of being requeued.
+    """
+
+    def __init__(self, send, on_success, on_dead_letter, max_attempts=5, base_delay=30.0, max_delay=3600.0):
+        self.send = send
+        self.on_success = on_success
+        self.on_dead_letter = on_dead_letter
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+        self._attempting = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def items(self):
+        """Items waiting for their next attempt or being attempted now."""
+        return [item for _, _, item in self._heap] + self._attempting
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        # Jitter para não sincronizar as tentativas de vários envios
+        return delay * random.uniform(0.5, 1.5)
+
+    def schedule(self, item, error=None):
+        """Queue `item` after a failed attempt; `item["attempts"]` counts failures so far."""
+        item.setdefault("history", [])
+        if error is not None:
+            item["attempts"] = item.get("attempts", 0) + 1
+            item["history"].append({"at": time.time(), "error": str(error)})
+        if item.get("attempts", 0) >= self.max_attempts:
+            self._start(self.on_dead_letter(item))
+            return
+        due = time.monotonic() + self.backoff(max(1, item.get("attempts", 0)))
+        heapq.heappush(self._heap, (due, next(self._counter), item))
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _start(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, item = heapq.heappop(self._heap)
+            self._start(self._attempt(item))
+
+    async def _attempt(self, item):
+        self._attempting.append(item)
+        try:
+            await self.send(item)
+        except Exception as e:
+            self.schedule(item, e)
+            return
+        finally:
+            self._attempting.remove(item)
+        await self.on_success(item)
+
+    async def stop(self):
+        """Stop the timer and drop queued items (they are reloaded on the next start)."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        self._heap.clear()
@@ -1,32 +1,263 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 import asyncio
-from app.utils.firebase_utils import check_new_documents, check_new_documents_aemc, check_new_messages_aemc
+import datetime
+import functools
+import logging
+from app.config import settings
+from app.db import db_async
+from app.template_registry import templates
+from app.metrics import MULTIPROCESS, POLL_INTERVAL, TICKS_SKIPPED, refresh_queue_depths
+from app.smtp_service import close_email_dispatcher, close_smtp_pool
+from app.tenants import DEFAULT_TENANT, tenants
+from app.utils.firebase_utils import (
+    PIPELINES, check, process, aemc_admins,
+    registration_writes, aemc_writes, WORKER_ID, outbox, replay_outbox,
+    retries, start_retries, events, drain_acks,
+)
+from app.utils.adaptive_interval import AdaptiveInterval
+from app.utils.listeners import SnapshotListener
+from app.utils.leader_election import LeaderLease
+from app.utils.run_state import RunState
 
-def start_scheduler():
-    scheduler = BackgroundScheduler()
+logger = logging.getLogger(__name__)
 
-    # Agendar a tarefa para rodar a cada 5 minutos
-    scheduler.add_job(
-        lambda: asyncio.run(check_new_documents()),
-        "interval",
-        minutes=5,
-        id="firebase_check_job"
-    )
+listeners = []
+lease = None
+warm_up = None
+# Arranques que esperam pelos clientes Firebase (lease, fila de push)
+startup_tasks = []
+# Estado de execução de cada job de polling, por job_id
+run_states = {}
 
-    scheduler.add_job(
-        lambda: asyncio.run(check_new_documents_aemc()),
-        "interval",
-        minutes=1,
-        id="firebase_check_job_aemc"
-    )
-    
-    scheduler.add_job(
-        lambda: asyncio.run(check_new_messages_aemc()),
-        "interval",
-        minutes=1,
-        id="firebase_check_job_aemc_messages"
+PIPELINE_JOB_IDS = tuple(pipeline.job_id for pipeline in PIPELINES.values())
+
+
+def start_listeners(loop):
+    """Open on_snapshot watch streams for every pipeline."""
+    listeners.extend(
+        SnapshotListener(pipeline.name, pipeline.query, functools.partial(process, pipeline), pipeline.fields)
+        for pipeline in PIPELINES.values()
     )
-    
+    for listener in listeners:
+        listener.start(loop)
+
+
+async def stop_listeners():
+    for listener in listeners:
+        await listener.stop()
+    listeners.clear()
+
+
+def check_listeners():
+    for listener in listeners:
+        listener.ensure_alive()
+
+
+def leader_only(tick):
+    """Skip a tick when this worker does not hold a valid lease."""
+    @functools.wraps(tick)
+    async def wrapper(*args):
+        if lease is not None and not lease.is_leader:
+            return None
+        return await tick(*args)
+    return wrapper
+
+
+def adaptive(scheduler, job_id, interval, tick):
+    """Move the job's next run by the delay `interval` derives from each tick's result."""
+    @functools.wraps(tick)
+    async def wrapper(*args):
+        processed = await tick(*args)
+        if processed is None:
+            return processed
+        delay = interval.update(processed, settings.poll_page_size)
+        POLL_INTERVAL.labels(job_id).set(interval.seconds)
+        job = scheduler.get_job(job_id)
+        # Um job pausado (worker despromovido) tem next_run_time None e deve continuar pausado
+        if job is not None and job.next_run_time is not None:
+            job.modify(next_run_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=delay))
+        return processed
+    return wrapper
+
+
+def record_job_event(event):
+    """Count pipeline ticks that the scheduler missed or refused to start.
+
+    Durations, overruns and coalesced ticks are recorded by each job's RunState.
+    """
+    if event.job_id in PIPELINE_JOB_IDS:
+        TICKS_SKIPPED.labels(event.job_id).inc()
+
+
+async def warm_up_tenants():
+    """Warm the tenants, then watch the AEMC admins on the already built client."""
+    await tenants.warm_up()
+    # O watch abre o stream de forma síncrona: fora do event loop
+    watching = asyncio.ensure_future(asyncio.to_thread(aemc_admins.watch))
+    try:
+        await asyncio.shield(watching)
+    except asyncio.CancelledError:
+        # A thread não se cancela; esperar por ela para que o unwatch do shutdown a apanhe
+        await asyncio.gather(watching, return_exceptions=True)
+        raise
+    except Exception as e:
+        # Sem o watch a cache expira apenas pelo TTL
+        logger.warning("Failed to watch AEMC admins: %s", e)
+
+
+async def build_then(build, start):
+    """Call `start()` once `build()` has created the Firebase clients off the event loop."""
+    try:
+        await build()
+    except Exception as e:
+        logger.warning("Failed to initialise Firebase clients: %s", e)
+    start()
+
+
+async def start_pipelines(scheduler, loop):
+    # Listeners e jobs usam os clientes de todos os tenants: construí-los fora do event loop
+    await tenants.build()
+    # Terminar primeiro o trabalho que ficou a meio no outbox
+    await replay_outbox()
+    await start_retries()
+    if settings.ingestion_mode == "listener":
+        start_listeners(loop)
+    for job_id in PIPELINE_JOB_IDS:
+        scheduler.resume_job(job_id)
+
+
+async def stop_pipelines(scheduler):
+    for job_id in PIPELINE_JOB_IDS:
+        try:
+            scheduler.pause_job(job_id)
+        except JobLookupError:
+            pass
+    await stop_listeners()
+    await drain_acks()
+
+
+async def start_scheduler():
+    """Start the pipeline jobs on the running event loop.
+
+    Must be called from inside the application's event loop (the FastAPI
+    lifespan): jobs are coroutines scheduled on that same loop, so the SMTP
+    and Firestore clients they use live across ticks. With leader election
+    enabled the pipelines only run while this worker holds the lease.
+    """
+    global lease, warm_up
+    loop = asyncio.get_running_loop()
+    # Abrir as ligações aos projetos Firebase sem atrasar o arranque
+    warm_up = loop.create_task(warm_up_tenants())
+    templates.load_all()
+    await outbox.open()
+    # Push e repetições correm em todos os workers: o claim de cada documento evita duplicados
+    startup_tasks.append(loop.create_task(build_then(tenants.build, events.start)))
+    retries.start()
+    scheduler = AsyncIOScheduler(event_loop=loop)
+
+    use_listeners = settings.ingestion_mode == "listener"
+    if use_listeners:
+        scheduler.add_job(
+            check_listeners,
+            "interval",
+            seconds=settings.listener_health_check_seconds,
+            id="firebase_listener_health_job"
+        )
+
+    if settings.ingestion_mode == "push" and not settings.events_token:
+        logger.warning("Ingestion mode is push but EVENTS_TOKEN is not set: /events refuses every request")
+
+    # Com listeners ou push ativos o polling serve apenas de reconciliação
+    fallback_minutes = settings.fallback_poll_minutes
+    reconcile_only = settings.ingestion_mode in ("listener", "push")
+
+    # Um job de polling por pipeline, com o intervalo declarado no registo
+    for pipeline in PIPELINES.values():
+        minutes = fallback_minutes if reconcile_only else pipeline.poll_minutes
+        tick = check
+        interval_seconds = lambda seconds=minutes * 60: seconds
+        if settings.adaptive_polling:
+            # O intervalo declarado é o ponto de partida; o teto nunca fica abaixo dele
+            interval = AdaptiveInterval(
+                minutes * 60,
+                settings.poll_floor_seconds,
+                max(settings.poll_ceiling_seconds, minutes * 60),
+                jitter=settings.poll_jitter,
+            )
+            POLL_INTERVAL.labels(pipeline.job_id).set(interval.seconds)
+            tick = adaptive(scheduler, pipeline.job_id, interval, tick)
+            interval_seconds = lambda interval=interval: interval.seconds
+        run_states[pipeline.name] = RunState(pipeline.job_id, interval_seconds)
+        scheduler.add_job(
+            leader_only(run_states[pipeline.name].guard(tick)),
+            "interval",
+            args=[pipeline],
+            minutes=minutes,
+            id=pipeline.job_id,
+            # Um segundo disparo só marca o job como pendente; atrasos viram uma única execução
+            max_instances=2,
+            coalesce=True,
+            misfire_grace_time=None,
+        )
+
+    if MULTIPROCESS:
+        # Um scrape pode cair noutro worker: as filas do líder têm de estar sempre publicadas
+        scheduler.add_job(
+            refresh_queue_depths,
+            "interval",
+            seconds=settings.metrics_refresh_seconds,
+            id="metrics_refresh_job"
+        )
+
+    scheduler.add_listener(record_job_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+
+    # Os pipelines só arrancam quando este worker é eleito líder
+    for job_id in PIPELINE_JOB_IDS:
+        scheduler.pause_job(job_id)
     scheduler.start()
+
+    if settings.leader_election_enabled:
+        lease = LeaderLease(
+            db_async,
+            "firebase_scheduler",
+            holder_id=WORKER_ID,
+            ttl=settings.leader_lease_ttl,
+            heartbeat=settings.leader_heartbeat_seconds,
+            on_elected=functools.partial(start_pipelines, scheduler, loop),
+            on_demoted=functools.partial(stop_pipelines, scheduler),
+        )
+        # O heartbeat usa o cliente do tenant por omissão
+        startup_tasks.append(loop.create_task(build_then(tenants[DEFAULT_TENANT].build, lease.start)))
+    else:
+        await start_pipelines(scheduler, loop)
     return scheduler
+
+
+async def stop_scheduler(scheduler):
+    global lease, warm_up
+    if warm_up is not None:
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+        warm_up = None
+    for task in startup_tasks:
+        task.cancel()
+    await asyncio.gather(*startup_tasks, return_exceptions=True)
+    startup_tasks.clear()
+    if lease is not None:
+        # Demote para os pipelines e liberta a lease para o standby
+        await lease.stop()
+        lease = None
+    else:
+        await stop_pipelines(scheduler)
+    await events.stop()
+    await retries.stop()
+    await drain_acks()
+    scheduler.shutdown(wait=False)
+    aemc_admins.unwatch()
+    await registration_writes.close()
+    await aemc_writes.close()
+    await close_email_dispatcher()
+    await close_smtp_pool()
+    await outbox.close()
@@ -1,32 +1,336 @@
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from aiosmtplib import send
+from email.policy import compat32
+import asyncio
+import functools
+import logging
+import time
+from aiosmtplib import SMTP, SMTPRecipientsRefused, SMTPResponseException, SMTPServerDisconnected
 from app.config import settings
+from app.metrics import SMTP_CONNECT_LATENCY, SMTP_SEND_LATENCY, track_queue_depth
 
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """An authenticated SMTP session plus the bookkeeping the pool needs."""
+
+    def __init__(self, client: SMTP):
+        self.client = client
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """Keep up to `size` authenticated SMTP sessions open and reuse them.
+
+    Idle sessions older than `idle_timeout` are closed, sessions idle for
+    more than `health_check_after` are probed with NOOP before reuse, and a
+    session is retired after `max_messages` sends. A 421/4xx reply or a
+    dropped connection discards the session and the send is retried once on
+    a fresh one.
+    """
+
+    def __init__(self, hostname, port, username, password, size=4, idle_timeout=60.0,
+                 health_check_after=10.0, max_messages=100, start_tls=True):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.start_tls = start_tls
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.max_messages = max_messages
+
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def _connect(self) -> PooledConnection:
+        client = SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            start_tls=self.start_tls,
+        )
+        with SMTP_CONNECT_LATENCY.time():
+            await client.connect()
+        return PooledConnection(client)
+
+    async def _discard(self, conn: PooledConnection):
+        try:
+            if conn.client.is_connected:
+                await conn.client.quit()
+        except Exception:
+            conn.client.close()
+
+    async def _acquire(self) -> PooledConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            idle_for = time.monotonic() - conn.last_used
+            if not conn.client.is_connected or idle_for > self.idle_timeout:
+                await self._discard(conn)
+                continue
+            if idle_for > self.health_check_after:
+                try:
+                    await conn.client.noop()
+                except Exception:
+                    await self._discard(conn)
+                    continue
+            return conn
+        return await self._connect()
+
+    def _release(self, conn: PooledConnection):
+        conn.last_used = time.monotonic()
+        self._idle.append(conn)
+
+    async def send_message(self, msg):
+        return await self._send(lambda client: client.send_message(msg))
+
+    async def sendmail(self, sender, recipients, message: bytes):
+        """Send an already serialized message to an explicit envelope."""
+        return await self._send(lambda client: client.sendmail(sender, recipients, message))
+
+    async def _send(self, operation):
+        async with self._slots:
+            for attempt in range(2):
+                conn = await self._acquire()
+                try:
+                    with SMTP_SEND_LATENCY.time():
+                        result = await operation(conn.client)
+                except (SMTPServerDisconnected, ConnectionError):
+                    await self._discard(conn)
+                    if attempt:
+                        raise
+                    continue
+                except SMTPResponseException as e:
+                    # 421 e outros 4xx: sessão possivelmente inválida, reconectar
+                    if 400 <= e.code < 500:
+                        await self._discard(conn)
+                        if attempt:
+                            raise
+                        continue
+                    self._release(conn)
+                    raise
+                except SMTPRecipientsRefused:
+                    # O aiosmtplib já enviou RSET: a sessão continua utilizável
+                    if conn.client.is_connected:
+                        self._release(conn)
+                    else:
+                        await self._discard(conn)
+                    raise
+                except asyncio.CancelledError:
+                    conn.client.close()
+                    raise
+                except Exception:
+                    # Timeout ou erro inesperado: estado da sessão desconhecido
+                    await self._discard(conn)
+                    raise
+
+                conn.messages_sent += 1
+                if conn.messages_sent >= self.max_messages or self._closed:
+                    await self._discard(conn)
+                else:
+                    self._release(conn)
+                return result
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+
+
+# Mesma serialização que o aiosmtplib usa em send_message (compat32 com CRLF)
+SMTP_POLICY = compat32.clone(linesep="\r\n")
+
+
+class PreparedMessage:
+    """A message serialized once, without its `To` header.
+
+    The MIME tree, the UTF-8/base64 encoding of the body and the
+    serialization to bytes are done once; `for_recipient()` only prepends the
+    recipient's `To` header, so every recipient of a document shares the
+    same encoded body.
+    """
+
+    def __init__(self, sender, subject, body):
+        self.sender = sender
 
-async def send_email_async(subject: str, body: str, to_email: str, doc_id: str = None):
-    """Send email asynchronously using aiosmtplib."""
-    try:
-        print(f"Attempting to send email for doc {doc_id} to {to_email}")
-        
         msg = MIMEMultipart()
-        msg["From"] = settings.smtp_user
-        msg["To"] = to_email
+        msg["From"] = sender
         msg["Subject"] = subject
         msg["Content-Type"] = 'text/html; charset="UTF-8"'
         msg.set_charset("UTF-8")
         msg.attach(MIMEText(body, "html", "utf-8"))
+        self.data = msg.as_bytes(policy=SMTP_POLICY)
+
+    def for_recipient(self, to_email) -> bytes:
+        return SMTP_POLICY.fold_binary("To", to_email) + self.data
+
+
+@functools.lru_cache(maxsize=64)
+def prepare_message(sender, subject, body) -> PreparedMessage:
+    # Os destinatários de um documento chegam seguidos, com o mesmo assunto e corpo
+    return PreparedMessage(sender, subject, body)
+
+
+class TokenBucket:
+    """Token bucket limiting sends to `rate` per second with bursts of `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
 
-        await send(
-            msg,
-            hostname=settings.smtp_host,
-            port=settings.smtp_port,
-            username=settings.smtp_user,
-            password=settings.smtp_password,
-            start_tls=True,
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class EmailDispatcher:
+    """Shared send stage for every pipeline.
+
+    Jobs are queued and drained by `concurrency` workers, so the number of
+    sends in flight is bounded globally rather than per document. Each send
+    first takes a token from the bucket of its SMTP host to stay under the
+    provider's throttling limits.
+    """
+
+    def __init__(self, concurrency=8, rate_per_host=5.0, burst_per_host=10, queue_size=1000):
+        self.concurrency = concurrency
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._buckets = {}
+        self._workers = []
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_per_host, self.burst_per_host)
+        return self._buckets[host]
+
+    def _ensure_workers(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def submit(self, subject: str, body: str, to_email: str, doc_id: str = None,
+                     raise_errors: bool = False) -> bool:
+        """Queue one (message, recipient) job and wait for its result."""
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((subject, body, to_email, doc_id, raise_errors, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            subject, body, to_email, doc_id, raise_errors, future = await self._queue.get()
+            try:
+                await self._bucket(settings.smtp_host).acquire()
+                result = await send_email_async(subject, body, to_email, doc_id, raise_errors)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        # Terminar os envios pendentes antes de parar os workers
+        if self._workers:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+_pool = None
+_dispatcher = None
+
+
+def get_smtp_pool() -> SMTPConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPConnectionPool(
+            settings.smtp_host,
+            settings.smtp_port,
+            settings.smtp_user,
+            settings.smtp_password,
+            size=settings.smtp_pool_size,
+            idle_timeout=settings.smtp_idle_timeout,
+            health_check_after=settings.smtp_health_check_after,
+            max_messages=settings.smtp_max_messages_per_connection,
+            start_tls=settings.smtp_start_tls,
+        )
+    return _pool
+
+
+async def close_smtp_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+track_queue_depth("email_dispatcher", lambda: _dispatcher._queue.qsize() if _dispatcher is not None else 0)
+
+
+def get_email_dispatcher() -> EmailDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = EmailDispatcher(
+            concurrency=settings.email_concurrency,
+            rate_per_host=settings.smtp_rate_per_second,
+            burst_per_host=settings.smtp_rate_burst,
         )
-        print(f"Successfully sent email for doc {doc_id} to {to_email}")
+    return _dispatcher
+
+
+async def close_email_dispatcher():
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.close()
+        _dispatcher = None
+
+
+async def dispatch_email(subject: str, body: str, to_email: str, doc_id: str = None,
+                         raise_errors: bool = False) -> bool:
+    """Send through the shared dispatcher (bounded concurrency and rate limit)."""
+    return await get_email_dispatcher().submit(subject, body, to_email, doc_id, raise_errors)
+
+
+async def send_email_async(subject: str, body: str, to_email: str, doc_id: str = None,
+                           raise_errors: bool = False):
+    """Send email asynchronously over a pooled SMTP connection.
+
+    Returns False on failure, or re-raises the error when `raise_errors` is set.
+    """
+    try:
+        logger.info("Attempting to send email for doc %s to %s", doc_id, to_email,
+                    extra={"doc_id": doc_id, "recipient": to_email, "sampled": True})
+
+        message = prepare_message(settings.smtp_user, subject, body)
+        await get_smtp_pool().sendmail(message.sender, [to_email], message.for_recipient(to_email))
+        logger.info("Successfully sent email for doc %s to %s", doc_id, to_email,
+                    extra={"doc_id": doc_id, "recipient": to_email, "sampled": True})
         return True
     except Exception as e:
-        print(f"Failed to send email for doc {doc_id} to {to_email}: {e}")
+        logger.warning("Failed to send email for doc %s to %s: %s", doc_id, to_email, e,
+                       extra={"doc_id": doc_id, "recipient": to_email})
+        if raise_errors:
+            raise
         return False
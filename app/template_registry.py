@@ -0,0 +1,143 @@
+import logging
+import os
+import re
+import time
+from app.utils.html_minify import minify_html
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
+# Tamanho máximo, em bytes, de um template já minificado
+TEMPLATE_SIZE_BUDGET = 40000
+
+
+class CompiledTemplate:
+    """An HTML template pre-split at its placeholders.
+
+    `placeholders` maps a slot name to the literal marker found in the file
+    (e.g. ``{"id": "{{ id }}"}``). Rendering is a single join over the
+    literal segments and the slot values, instead of one full-string
+    ``str.replace`` copy per marker. The file is re-read only when its mtime
+    changes, checked at most once every `check_interval` seconds.
+
+    With `minify` the HTML is minified once per load (see
+    `app.utils.html_minify`) and the result is what gets compiled, so every
+    render and every SMTP send uses the smaller body. A template whose
+    minified size exceeds `size_budget` bytes is reported with a warning.
+    """
+
+    def __init__(self, path, placeholders, check_interval=2.0, minify=True, size_budget=None):
+        self.path = path
+        self.placeholders = placeholders
+        self.check_interval = check_interval
+        self.minify = minify
+        self.size_budget = size_budget
+        self.source_size = None
+        self.size = None
+
+        self._markers = {marker: name for name, marker in placeholders.items()}
+        # Marcadores mais longos primeiro para não partir um marcador que contém outro
+        alternatives = sorted(self._markers, key=len, reverse=True)
+        self._pattern = re.compile("(" + "|".join(re.escape(m) for m in alternatives) + ")")
+
+        self._mtime = None
+        self._checked_at = 0.0
+        self._literals = []
+        self._slots = []
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as file:
+            html_content = file.read()
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._checked_at = time.monotonic()
+        if self.minify:
+            html_content = self._minified(html_content)
+        self._compile(html_content)
+
+    def _minified(self, html_content):
+        minified = minify_html(html_content)
+        # Os marcadores têm de sobreviver intactos, senão fica o HTML original
+        for marker in self._markers:
+            if minified.count(marker) != html_content.count(marker):
+                logger.warning("Minifying %s changed placeholder %r, using it unminified", self.path, marker)
+                return html_content
+
+        self.source_size = len(html_content.encode("utf-8"))
+        self.size = len(minified.encode("utf-8"))
+        logger.info("Template %s: %d -> %d bytes", os.path.basename(self.path), self.source_size, self.size)
+        if self.size_budget and self.size > self.size_budget:
+            logger.warning("Template %s is %d bytes, over its budget of %d",
+                           os.path.basename(self.path), self.size, self.size_budget)
+        return minified
+
+    def _compile(self, html_content):
+        parts = self._pattern.split(html_content)
+        self._literals = parts[0::2]
+        self._slots = [self._markers[marker] for marker in parts[1::2]]
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        if self._mtime is None or os.stat(self.path).st_mtime_ns != self._mtime:
+            self.load()
+
+    def render(self, **values):
+        self._reload_if_changed()
+        literals = self._literals
+        out = [literals[0]]
+        for index, name in enumerate(self._slots, 1):
+            out.append(values[name])
+            out.append(literals[index])
+        return "".join(out)
+
+
+class TemplateRegistry:
+    """Named compiled templates, loaded once and shared by every pipeline."""
+
+    def __init__(self, base_dir=TEMPLATES_DIR, minify=True, size_budget=None):
+        self.base_dir = base_dir
+        self.minify = minify
+        self.size_budget = size_budget
+        self._templates = {}
+
+    def register(self, name, filename, placeholders):
+        self._templates[name] = CompiledTemplate(
+            os.path.join(self.base_dir, filename), placeholders,
+            minify=self.minify, size_budget=self.size_budget)
+
+    def load_all(self):
+        for template in self._templates.values():
+            template.load()
+
+    def get(self, name) -> CompiledTemplate:
+        return self._templates[name]
+
+    def render(self, template_name, /, **values):
+        return self._templates[template_name].render(**values)
+
+    def sizes(self):
+        """{name: (source bytes, compiled bytes)} of the loaded templates."""
+        return {name: (template.source_size, template.size) for name, template in self._templates.items()}
+
+
+templates = TemplateRegistry(size_budget=TEMPLATE_SIZE_BUDGET)
+templates.register("confirmation", "confirmation.template.html", {"id": "{{ id }}"})
+templates.register("message", "message.template.html", {
+    "subject": "aemcSubject",
+    "name": "aemcName",
+    "email": "aemcEmail",
+    "message": "aemcMessage",
+})
+templates.register("requestmember", "requestmember.template.html", {"name": "AiTECH"})
+templates.register("requestadmin", "requestadmin.template.html", {"name": "AiTECH"})
+templates.register("responsemember", "responsemember.template.html", {
+    "name": "AiTECH",
+    "email": "adminEmail",
+    "password": "adminPassword",
+})
+templates.register("rejectmember", "rejectmember.template.html", {
+    "name": "AiTECH",
+    "reason": "aemcReason",
+})
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import threading
+import firebase_admin
+from firebase_admin import auth, credentials, firestore, firestore_async
+from app.config import settings
+from app.utils.checkpoints import CHECKPOINTS_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Tenant cujo projeto é a app Firebase por omissão
+DEFAULT_TENANT = "default"
+# Documento lido no warm-up só para abrir o canal gRPC; não precisa de existir
+WARMUP_DOCUMENT = "__warmup__"
+
+
+class FirebaseTenant:
+    """One Firebase project and its clients, created on first use.
+
+    Nothing is read from disk or initialised at import: the service-account
+    file is loaded and the app initialised the first time a client is asked
+    for, so a missing key only fails the pipelines of that tenant. Each
+    client is built once and shared by every module that uses the tenant;
+    the Firestore clients are also cached per app by firebase_admin, so they
+    reuse the same gRPC channel.
+    """
+
+    def __init__(self, name, credentials_path):
+        self.name = name
+        self.credentials_path = credentials_path
+
+        self._app = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"FirebaseTenant({self.name!r})"
+
+    @property
+    def app(self):
+        with self._lock:
+            if self._app is None:
+                cred = credentials.Certificate(self.credentials_path)
+                if self.name == DEFAULT_TENANT:
+                    self._app = firebase_admin.initialize_app(cred)
+                else:
+                    self._app = firebase_admin.initialize_app(cred, name=f"{self.name}-app")
+            return self._app
+
+    def _client(self, kind, factory):
+        with self._lock:
+            if kind in self._clients:
+                return self._clients[kind]
+        app = self.app
+        with self._lock:
+            if kind not in self._clients:
+                self._clients[kind] = factory(app)
+            return self._clients[kind]
+
+    def use_clients(self, **clients):
+        """Serve these clients instead of building them (e.g. in-memory fakes for load tests)."""
+        with self._lock:
+            self._clients.update(clients)
+
+    @property
+    def db(self):
+        # Cliente síncrono, usado pelos watch streams (on_snapshot)
+        return self._client("db", lambda app: firestore.client(app=app))
+
+    @property
+    def db_async(self):
+        return self._client("db_async", lambda app: firestore_async.client(app=app))
+
+    @property
+    def auth(self):
+        return self._client("auth", lambda app: auth.Client(app=app))
+
+    def lazy(self, kind):
+        """Handle to one of the clients that only builds it when first used."""
+        return LazyClient(self, kind)
+
+    async def build(self):
+        """Build the clients on a worker thread, so the event loop never loads credentials."""
+        await asyncio.to_thread(lambda: (self.db, self.db_async, self.auth))
+
+    async def warm_up(self):
+        """Build the clients off the event loop and open the Firestore channel."""
+        await self.build()
+        await self.db_async.collection(CHECKPOINTS_COLLECTION).document(WARMUP_DOCUMENT).get()
+
+
+class LazyClient:
+    """Stand-in for a tenant client, resolved on first attribute access.
+
+    Lets modules keep module-level clients (`from app.db import db_async`)
+    without initialising Firebase when they are imported.
+    """
+
+    def __init__(self, tenant, kind):
+        self._tenant = tenant
+        self._kind = kind
+
+    def __repr__(self):
+        return f"LazyClient({self._tenant.name!r}, {self._kind!r})"
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._tenant, self._kind), name)
+
+
+class TenantRegistry:
+    """Firebase projects configured in `firebase_tenants` (name -> key file)."""
+
+    def __init__(self, tenant_credentials):
+        self._tenants = {
+            name: FirebaseTenant(name, credentials_path)
+            for name, credentials_path in tenant_credentials.items()
+        }
+
+    def __getitem__(self, name):
+        return self._tenants[name]
+
+    def __iter__(self):
+        return iter(self._tenants.values())
+
+    async def build(self):
+        """Build every tenant's clients off the event loop; failures are logged, not raised."""
+        results = await asyncio.gather(*(tenant.build() for tenant in self), return_exceptions=True)
+        for tenant, result in zip(self, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to initialise tenant %s: %s", tenant.name, result)
+
+    async def warm_up(self):
+        """Warm every tenant concurrently; failures are logged, not raised."""
+        results = await asyncio.gather(*(tenant.warm_up() for tenant in self), return_exceptions=True)
+        for tenant, result in zip(self, results):
+            if isinstance(result, Exception):
+                logger.warning("Failed to warm up tenant %s: %s", tenant.name, result)
+            else:
+                logger.info("Tenant %s is ready", tenant.name)
+
+
+tenants = TenantRegistry(settings.firebase_tenants)
@@ -0,0 +1,29 @@
+import random
+
+
+class AdaptiveInterval:
+    """Poll interval that follows the progress made by the last tick.
+
+    `processed` counts the documents a tick actually sent, never the ones
+    it only read again. A tick that sent at least one page means documents
+    are arriving faster than they are drained, so the interval is divided
+    by `factor` down to `floor`. A tick that sent nothing multiplies it by
+    `factor` up to `ceiling`. Partial pages keep the current interval. The returned delay
+    is spread by ±`jitter` so replicas restarted together do not poll in
+    lockstep; the stored interval itself is not jittered.
+    """
+
+    def __init__(self, initial, floor, ceiling, factor=2.0, jitter=0.1):
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.factor = factor
+        self.jitter = jitter
+        self.seconds = min(max(initial, self.floor), self.ceiling)
+
+    def update(self, processed, page_size):
+        """Record how many documents a tick sent; returns the delay until the next tick."""
+        if processed >= page_size:
+            self.seconds = max(self.floor, self.seconds / self.factor)
+        elif processed == 0:
+            self.seconds = min(self.ceiling, self.seconds * self.factor)
+        return self.seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
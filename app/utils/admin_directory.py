@@ -0,0 +1,72 @@
+import asyncio
+import time
+from firebase_admin import auth
+
+# Limite de identificadores por chamada de auth.get_users
+GET_USERS_BATCH_SIZE = 100
+
+
+class AdminDirectory:
+    """Cached list of admin emails for a Firebase project.
+
+    Admin UIDs come from the documents of `users` with role == 'admin'; the
+    emails are resolved in bulk with `get_users` (100 UIDs per call). The
+    result is cached for `ttl` seconds and dropped as soon as the watch on
+    the admins query reports a change, so every message and notification of
+    a tick shares a single lookup.
+    """
+
+    def __init__(self, db, async_db, auth_client, ttl=300):
+        self.db = db
+        self.async_db = async_db
+        self.auth_client = auth_client
+        self.ttl = ttl
+
+        self._emails = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self._watch = None
+
+    def _admins_query(self, client):
+        return client.collection('users').where('role', '==', 'admin').select(['role'])
+
+    async def _resolve(self):
+        uids = [doc.id async for doc in self._admins_query(self.async_db).stream()]
+        emails_by_uid = {}
+        for start in range(0, len(uids), GET_USERS_BATCH_SIZE):
+            identifiers = [auth.UidIdentifier(uid) for uid in uids[start:start + GET_USERS_BATCH_SIZE]]
+            # O SDK de Auth só tem API síncrona
+            result = await asyncio.to_thread(self.auth_client.get_users, identifiers)
+            for user in result.users:
+                emails_by_uid[user.uid] = user.email
+        # Manter a ordem dos documentos e ignorar utilizadores sem email
+        return [emails_by_uid[uid] for uid in uids if emails_by_uid.get(uid)]
+
+    async def get_emails(self):
+        if self._emails is not None and time.monotonic() < self._expires_at:
+            return self._emails
+        async with self._lock:
+            # Outro pedido pode ter atualizado a cache enquanto esperávamos
+            if self._emails is None or time.monotonic() >= self._expires_at:
+                generation = self._generation
+                emails = await self._resolve()
+                self._emails = emails
+                # Se a cache foi invalidada durante a consulta, não a reutilizar
+                self._expires_at = time.monotonic() + self.ttl if generation == self._generation else 0.0
+                return emails
+            return self._emails
+
+    def invalidate(self):
+        self._generation += 1
+        self._emails = None
+
+    def watch(self):
+        """Invalidate the cache whenever an admin is added, changed or removed."""
+        if self._watch is None:
+            self._watch = self._admins_query(self.db).on_snapshot(lambda docs, changes, read_time: self.invalidate())
+
+    def unwatch(self):
+        watch, self._watch = self._watch, None
+        if watch is not None:
+            watch.unsubscribe()
@@ -0,0 +1,33 @@
+import datetime
+
+CHECKPOINTS_COLLECTION = 'scheduler_checkpoints'
+
+
+class CheckpointStore:
+    """High-water marks of the poll scans, kept in a Firestore metadata doc.
+
+    Each pipeline stores the created-at value and id of the last document
+    it finished, in `scheduler_checkpoints/{pipeline}`. The next scan starts
+    right after it, so a tick only reads documents it has not seen and a
+    restart resumes where the previous process stopped. `db` is an
+    AsyncClient.
+    """
+
+    def __init__(self, db, collection=CHECKPOINTS_COLLECTION):
+        self.db = db
+        self.collection = collection
+        self._cache = {}
+
+    async def load(self, pipeline):
+        if pipeline not in self._cache:
+            snapshot = await self.db.collection(self.collection).document(pipeline).get()
+            self._cache[pipeline] = snapshot.to_dict() if snapshot.exists else None
+        return self._cache[pipeline]
+
+    async def save(self, pipeline, created_at, doc_id):
+        checkpoint = {"created_at": created_at, "doc_id": doc_id}
+        await self.db.collection(self.collection).document(pipeline).set({
+            **checkpoint,
+            "updated_at": datetime.datetime.now(datetime.timezone.utc),
+        })
+        self._cache[pipeline] = checkpoint
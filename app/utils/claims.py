@@ -0,0 +1,60 @@
+import datetime
+import zlib
+from google.cloud import firestore
+
+
+class DocumentClaimer:
+    """Claim documents so parallel workers never process the same one.
+
+    A worker first checks that the document falls in its shard
+    (crc32(doc_id) % shard_count == shard_index), so workers on disjoint
+    shards never contend. It then takes the document with a transactional
+    compare-and-set on `claimed_by`/`lease_until`: the claim succeeds only
+    if the document is still pending and is unclaimed, already ours, or its
+    previous claim has expired. `db` is an AsyncClient.
+    """
+
+    def __init__(self, db, worker_id, lease_seconds=300, shard_count=1, shard_index=0):
+        self.db = db
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.shard_count = max(1, shard_count)
+        self.shard_index = shard_index
+
+    def owns(self, doc_id):
+        return zlib.crc32(doc_id.encode("utf-8")) % self.shard_count == self.shard_index
+
+    async def _claim(self, doc_ref, is_pending, fields):
+        transaction = self.db.transaction()
+
+        @firestore.async_transactional
+        async def claim(transaction):
+            snapshot = await doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            data = snapshot.to_dict()
+            if not is_pending(data):
+                return False
+            now = datetime.datetime.now(datetime.timezone.utc)
+            claimed_by = data.get('claimed_by')
+            lease_until = data.get('lease_until')
+            if claimed_by not in (None, self.worker_id) and lease_until and lease_until > now:
+                return False
+            transaction.update(doc_ref, {
+                'claimed_by': self.worker_id,
+                'lease_until': now + datetime.timedelta(seconds=self.lease_seconds),
+                **fields,
+            })
+            return True
+
+        return await claim(transaction)
+
+    async def claim(self, doc_ref, is_pending, fields=None):
+        """Try to claim `doc_ref`, writing `fields` in the same transaction.
+
+        `is_pending(data)` re-checks, inside the transaction, that the document
+        still matches the pipeline query.
+        """
+        if not self.owns(doc_ref.id):
+            return False
+        return await self._claim(doc_ref, is_pending, fields or {})
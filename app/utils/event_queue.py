@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventQueue:
+    """Bounded queue of pushed document ids, drained by a fixed set of workers.
+
+    Each entry is a (pipeline, doc_id) pair. A worker re-reads the document
+    with `fetch(pipeline, doc_id)` and hands it to the pipeline's handler,
+    so a pushed event goes through the same claim, outbox and ack as a
+    polled document and its payload is never trusted. `submit()` never
+    waits: when the queue is full it raises asyncio.QueueFull so the caller
+    can ask the sender to retry.
+    """
+
+    def __init__(self, fetch, handlers, concurrency=20, max_size=10000):
+        self.fetch = fetch
+        self.handlers = handlers
+        self.concurrency = concurrency
+
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._workers = []
+
+    @property
+    def is_running(self):
+        return bool(self._workers)
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def submit(self, pipeline, doc_ids):
+        """Queue the documents of `pipeline`; returns how many were queued."""
+        if pipeline not in self.handlers:
+            raise KeyError(pipeline)
+        if self._queue.maxsize and self._queue.qsize() + len(doc_ids) > self._queue.maxsize:
+            raise asyncio.QueueFull
+        for doc_id in doc_ids:
+            self._queue.put_nowait((pipeline, doc_id))
+        return len(doc_ids)
+
+    def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def _worker(self):
+        while True:
+            pipeline, doc_id = await self._queue.get()
+            try:
+                doc = await self.fetch(pipeline, doc_id)
+                if doc is not None:
+                    await self.handlers[pipeline](doc)
+            except Exception:
+                logger.exception("Error processing pushed document %s", doc_id,
+                                 extra={"pipeline": pipeline, "doc_id": doc_id})
+            finally:
+                self._queue.task_done()
+
+    async def stop(self):
+        # Terminar os documentos já recebidos antes de parar os workers
+        if self._workers:
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -1,12 +1,28 @@
-from app.db import db
-from app.db_aemc import dbAemc, authAemc
-from app.smtp_service import send_email_async
+from app.db import db, db_async
+from app.db_aemc import dbAemc, dbAemcAsync, authAemc
+from app.smtp_service import dispatch_email
 from app.config import settings
+from app.template_registry import templates
+from app.utils.admin_directory import AdminDirectory
+from app.utils.write_buffer import WriteBuffer
+from app.utils.claims import DocumentClaimer
+from app.utils.leader_election import default_holder_id
+from app.utils.checkpoints import CheckpointStore
+from app.utils.event_queue import EventQueue
+from app.utils.pipeline import Pipeline
+from app.outbox import Outbox, outbox_key
+from app.retry import RetryScheduler
+from app.metrics import (
+    DOCS_FETCHED, EMAILS_FAILED, EMAILS_SENT, END_TO_END_LATENCY, QUERY_LATENCY, RENDER_LATENCY, track_queue_depth,
+)
 import datetime
 import asyncio
+import functools
+import logging
+import threading
+import time
 
-# Variável global para controlar o último timestamp verificado
-last_checked = datetime.datetime.utcnow()
+logger = logging.getLogger(__name__)
 
 
 def get_email_recipients(doc_data):
@@ -45,190 +61,395 @@ def get_email_recipients(doc_data):
     return recipients
 
 
-async def check_new_documents():
-    """Check for new documents in Firebase and send emails asynchronously."""
-    global last_checked
+# Emails dos administradores AEMC, partilhados por todas as mensagens e notificações
+aemc_admins = AdminDirectory(dbAemc, dbAemcAsync, authAemc, ttl=settings.admin_cache_ttl)
+
+# Atualizações de estado agrupadas em batched writes, uma fila por base de dados
+registration_writes = WriteBuffer(db_async, flush_interval=settings.write_flush_interval)
+aemc_writes = WriteBuffer(dbAemcAsync, flush_interval=settings.write_flush_interval)
+
+# Marcas de progresso dos scans paginados
+registration_checkpoints = CheckpointStore(db_async)
+aemc_checkpoints = CheckpointStore(dbAemcAsync)
+
+# Emails renderizados ficam no outbox antes do envio e do ack no Firestore
+outbox = Outbox(settings.outbox_path, flush_interval=settings.outbox_flush_interval)
+
+# Identidade deste worker para claims e para a lease do scheduler
+WORKER_ID = settings.worker_id or default_holder_id()
+
+registration_claims = DocumentClaimer(
+    db_async, WORKER_ID, settings.claim_lease_seconds, settings.shard_count, settings.shard_index)
+aemc_claims = DocumentClaimer(
+    dbAemcAsync, WORKER_ID, settings.claim_lease_seconds, settings.shard_count, settings.shard_index)
+
+# Documentos em processamento neste processo (listener, push e polling partilham o set)
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def single_flight(handler):
+    """Skip a document that is already being handled by another ingestion path."""
+    @functools.wraps(handler)
+    async def wrapper(pipeline, doc):
+        key = (pipeline.name, doc["id"])
+        with _in_flight_lock:
+            if key in _in_flight:
+                logger.info("Document %s is already being processed, skipping", doc["id"],
+                            extra={"pipeline": pipeline.name, "doc_id": doc["id"]})
+                return
+            _in_flight.add(key)
+        result = None
+        try:
+            result = await handler(pipeline, doc)
+            return result
+        finally:
+            if isinstance(result, asyncio.Future):
+                # Continua em processamento até o ack em segundo plano terminar
+                result.add_done_callback(lambda _: release(key))
+            else:
+                release(key)
+    return wrapper
+
+
+def release(key):
+    with _in_flight_lock:
+        _in_flight.discard(key)
+
+
+async def fetch_documents(query, pipeline):
+    """Yield documents as the query stream delivers them."""
+    stream = query.stream().__aiter__()
+    waited = 0.0
     try:
-        collection_ref = db.collection(settings.firebase_collection)
-        query = collection_ref.where('notification', '==', []).stream()
-
-        new_documents = []
-        for doc in query:
-            new_documents.append({"id": doc.id, **doc.to_dict()})
-
-        if new_documents:
-            print(f"Found {len(new_documents)} new documents.")
-            
-            for doc in new_documents:
-                doc_id = doc["id"]
-                print(f"Processing document {doc_id}")
-                
-                subject = "Confirmação de Receção de Inscrição"
-                body = generate_email_body(doc_id)
-
-                recipients = get_email_recipients(doc)
-                print(f"Recipients for document {doc_id}: {recipients}")
-
-                if recipients:
-                    try:
-                        # Primeiro atualizar o documento para evitar processamento duplicado
-                        doc_ref = collection_ref.document(doc_id)
-                        doc_ref.update({
-                            "notification": [datetime.datetime.utcnow()],
-                            "email_status": "processing"
-                        })
-                        
-                        # Criar e executar as tasks de email
-                        tasks = [send_email_async(subject, body, recipient, doc_id) 
-                                for recipient in recipients]
-                        
-                        # Aguardar o envio de todos os emails
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
-                        
-                        # Verificar se todos os emails foram enviados com sucesso
-                        success = all(result is True for result in results)
-                        
-                        # Atualizar status final
-                        doc_ref.update({
-                            "email_status": "completed" if success else "partial_failure",
-                            "email_sent_at": datetime.datetime.utcnow()
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error processing document {doc_id}: {e}")
-                        # Marcar documento com erro
-                        doc_ref.update({
-                            "email_status": "failed",
-                            "error_message": str(e)
-                        })
-
-        last_checked = datetime.datetime.utcnow()
-    except Exception as e:
-        print(f"Error while checking documents: {e}")
-        
-async def check_new_messages_aemc():
-    """Check for new messages in Firebase and send emails asynchronously."""
-    global last_checked
+        while True:
+            # Medir só a espera pelo Firestore, não o processamento entre documentos
+            started = time.perf_counter()
+            try:
+                doc = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                waited += time.perf_counter() - started
+            DOCS_FETCHED.labels(pipeline, "poll").inc()
+            yield {"id": doc.id, **doc.to_dict()}
+    finally:
+        QUERY_LATENCY.labels(pipeline).observe(waited)
+
+
+async def process_stream(documents, handler):
+    """Run `handler` over a document stream, `document_concurrency` at a time; returns how many ran."""
+    semaphore = asyncio.Semaphore(settings.document_concurrency)
+    tasks = set()
+    count = 0
+
+    async def run(doc):
+        try:
+            await handler(doc)
+        except Exception:
+            logger.exception("Error processing document %s", doc["id"], extra={"doc_id": doc["id"]})
+        finally:
+            semaphore.release()
+
     try:
-        collection_ref = dbAemc.collection('messages')
-        query = collection_ref.where('read', '==', False).stream()
-        
-        new_messages = []
-        for doc in query:
-            new_messages.append({"id": doc.id, **doc.to_dict()})
-
-        if new_messages:
-            print(f"Found {len(new_messages)} new messages.")
-            
-            for doc in new_messages:
-                doc_id = doc["id"]
-                print(f"Processing message {doc_id}")
-
-                subject = doc.get('assunto')
-                name = doc.get('nome')
-                email = doc.get('email')
-                message = doc.get('mensagem')
-                
-                recipients = fetch_aemc_admin_emails()
-
-                if recipients:
-                    try:
-                        doc_ref = collection_ref.document(doc_id)
-                        
-                        body = generate_aemc_message_body(subject, name, email, message)
-                        
-                        tasks = [send_email_async("AEMC - Nova Mensagem", body, recipient, doc_id) 
-                                for recipient in recipients]
-                        
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
-                        
-                        success = all(result is True for result in results)
-                        
-                        doc_ref.update({
-                            "read": True
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error processing message {doc_id}: {e}")
-                        # Marcar documento com erro
-                        doc_ref.update({
-                            "error_message": str(e)
-                        })
-    except Exception as e:
-        print(f"Error while checking messages: {e}")
+        async for doc in documents:
+            await semaphore.acquire()
+            task = asyncio.create_task(run(doc))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            count += 1
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return count
+
+
+async def scan_new_documents(pipeline, query, created_field, handler, checkpoints):
+    """Page through `query` after the pipeline's checkpoint; returns the number of documents sent."""
+    checkpoint_key = pipeline
+    if settings.shard_count > 1:
+        checkpoint_key = f"{pipeline}-shard{settings.shard_index}"
+    cursor = await checkpoints.load(checkpoint_key)
+    # O checkpoint só avança sobre os documentos terminados; o primeiro por terminar fixa-o até à próxima
+    held = False
+    sent = 0
+    while True:
+        page_query = query.order_by(created_field).order_by('__name__').limit(settings.poll_page_size)
+        if cursor:
+            page_query = page_query.start_after({
+                created_field: cursor["created_at"],
+                '__name__': cursor["doc_id"],
+            })
+
+        docs = []
+        finished = {}
+
+        async def page():
+            async for doc in fetch_documents(page_query, pipeline):
+                docs.append(doc)
+                yield doc
+
+        async def handle(doc):
+            result = await handler(doc)
+            if result:
+                finished[doc["id"]] = result
+
+        count = await process_stream(page(), handle)
+        # Os acks confirmam-se em segundo plano; só o checkpoint espera por eles
+        acks = {doc_id: result for doc_id, result in finished.items() if isinstance(result, asyncio.Future)}
+        for doc_id, acked in zip(acks, await asyncio.gather(*acks.values())):
+            if acked:
+                sent += 1
+            else:
+                del finished[doc_id]
+        if docs:
+            cursor = {"created_at": docs[-1].get(created_field), "doc_id": docs[-1]["id"]}
+
+        done = None
+        for doc in docs:
+            if held or doc["id"] not in finished:
+                held = True
+                break
+            done = doc
+        if done is not None:
+            await checkpoints.save(checkpoint_key, done.get(created_field), done["id"])
+        if count < settings.poll_page_size:
+            return sent
+
+
+# Campos lidos por cada pipeline; o polling projeta apenas estes (.select)
+REGISTRATION_FIELDS = [
+    'educationGuardian',
+    'filiation.father.email',
+    'filiation.mother.email',
+    'guardian.email',
+]
+AEMC_MESSAGE_FIELDS = ['assunto', 'nome', 'email', 'mensagem']
+AEMC_NOTIFICATION_FIELDS = ['type', 'name', 'to', 'adminEmail', 'adminPassword', 'reason']
+
+
+def observe_end_to_end(pipeline, created_at):
+    if isinstance(created_at, datetime.datetime) and created_at.tzinfo is not None:
+        elapsed = datetime.datetime.now(datetime.timezone.utc) - created_at
+        END_TO_END_LATENCY.labels(pipeline).observe(elapsed.total_seconds())
+
+
+async def deliver(pipeline, doc_id, subject, body, recipients, created_at=None):
+    """Send a document's emails through the outbox; True if every recipient got it."""
+    statuses = await outbox.enqueue(pipeline, doc_id, subject, body, recipients)
+    to_send = [recipient for recipient in recipients if statuses.get(recipient) != "sent"]
+
+    # Criar e executar as tasks de email
+    tasks = [dispatch_email(subject, body, recipient, doc_id, raise_errors=True) for recipient in to_send]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    outcomes = {recipient: result is True for recipient, result in zip(to_send, results)}
+    errors = {recipient: str(result) for recipient, result in zip(to_send, results) if result is not True}
+    for ok in outcomes.values():
+        if ok:
+            EMAILS_SENT.labels(pipeline).inc()
+            observe_end_to_end(pipeline, created_at)
+        else:
+            EMAILS_FAILED.labels(pipeline).inc()
+    if outcomes:
+        await outbox.mark_results(pipeline, doc_id, outcomes, errors)
+    for recipient, error in errors.items():
+        retries.schedule({
+            "pipeline": pipeline, "doc_id": doc_id, "recipient": recipient,
+            "subject": subject, "body": body,
+        }, error)
+    return all(outcomes.values())
+
+
+async def ack(pipeline, doc_id, success):
+    """Write the pipeline's ack fields and mark the outbox rows as acked."""
+    await pipeline.writes.update(pipeline.document(doc_id), pipeline.ack_fields(success))
+    await outbox.mark_acked(pipeline.name, doc_id)
+
+
+# Acks à espera do próximo batched write
+pending_acks = set()
+
+
+async def _ack_logged(pipeline, doc_id, success):
+    try:
+        await ack(pipeline, doc_id, success)
+        return True
+    except Exception:
+        logger.exception("Failed to ack document %s", doc_id, extra={"pipeline": pipeline.name, "doc_id": doc_id})
+        return False
+
 
+def ack_in_background(pipeline, doc_id, success):
+    """Start the ack without waiting for its batched write; the task resolves to True once it commits."""
+    task = asyncio.get_running_loop().create_task(_ack_logged(pipeline, doc_id, success))
+    pending_acks.add(task)
+    task.add_done_callback(pending_acks.discard)
+    return task
 
 
+async def drain_acks():
+    if pending_acks:
+        await asyncio.gather(*pending_acks, return_exceptions=True)
 
-async def check_new_documents_aemc():
-    """Check for new documents in Firebase and send emails asynchronously."""
-    global last_checked
+
+async def retry_send(item):
     try:
-        collection_ref = dbAemc.collection('notifications')
-        query = collection_ref.where('read', '==', False).stream()
-
-        new_documents = []
-        for doc in query:
-            new_documents.append({"id": doc.id, **doc.to_dict()})
-
-        if new_documents:
-            print(f"Found {len(new_documents)} new documents.")
-
-            for doc in new_documents:
-                doc_id = doc["id"]
-                print(f"Processing document {doc_id}")
-
-                subject = parse_aemc_subject(doc.get('type'))
-                name = doc.get('name')
-                recipients = get_aemc_email_recipients(doc.get('to'))
-                body = generate_aemc_email_body(doc.get('type'), doc.get('name'), doc.get('adminEmail') or None, doc.get('adminPassword') or None, doc.get('reason') or None)
-
-                if recipients:
-                    try:
-                        # Primeiro atualizar o documento para evitar processamento duplicado
-                        doc_ref = collection_ref.document(doc_id)
-                        
-                        # Criar e executar as tasks de email
-                        tasks = [send_email_async(subject, body, recipient, doc_id) 
-                                for recipient in recipients]
-                        
-                        # Aguardar o envio de todos os emails
-                        results = await asyncio.gather(*tasks, return_exceptions=True)
-                        
-                        # Verificar se todos os emails foram enviados com sucesso
-                        success = all(result is True for result in results)
-                        
-                        doc_ref.update({
-                            "read": True
-                        })
-                        
-                    except Exception as e:
-                        print(f"Error processing document {doc_id}: {e}")
-                        # Marcar documento com erro
-                        doc_ref.update({
-                            "error_message": str(e)
-                        })
-                        
-
-        last_checked = datetime.datetime.utcnow()
+        await dispatch_email(item["subject"], item["body"], item["recipient"], item["doc_id"], raise_errors=True)
+        EMAILS_SENT.labels(item["pipeline"]).inc()
     except Exception as e:
-        print(f"Error while checking documents: {e}")
+        EMAILS_FAILED.labels(item["pipeline"]).inc()
+        await outbox.mark_results(item["pipeline"], item["doc_id"], {item["recipient"]: False}, {item["recipient"]: str(e)})
+        raise
+
+
+async def retry_succeeded(item):
+    pipeline, doc_id = item["pipeline"], item["doc_id"]
+    await outbox.mark_results(pipeline, doc_id, {item["recipient"]: True})
+    logger.info("Retry succeeded for doc %s to %s after %d failures", doc_id, item["recipient"], item["attempts"],
+                extra={"pipeline": pipeline, "doc_id": doc_id, "recipient": item["recipient"]})
+    statuses = await outbox.statuses(pipeline, doc_id)
+    if all(status == "sent" for status in statuses.values()):
+        await ack(PIPELINES[pipeline], doc_id, True)
+
+
+async def dead_letter(item):
+    """Move a send that exhausted its retries to the dead-letter collection."""
+    pipeline, doc_id, recipient = item["pipeline"], item["doc_id"], item["recipient"]
+    logger.error("Giving up on doc %s to %s after %d attempts", doc_id, recipient, item["attempts"],
+                 extra={"pipeline": pipeline, "doc_id": doc_id, "recipient": recipient})
+    try:
+        key = outbox_key(pipeline, doc_id, recipient).replace("/", "_")
+        await PIPELINES[pipeline].client.collection(DEAD_LETTER_COLLECTION).document(key).set({
+            "pipeline": pipeline,
+            "doc_id": doc_id,
+            "recipient": recipient,
+            "subject": item["subject"],
+            "attempts": item["attempts"],
+            "history": item["history"],
+            "dead_at": datetime.datetime.utcnow(),
+        })
+        await outbox.mark_dead(pipeline, doc_id, recipient)
+    except Exception:
+        logger.exception("Failed to dead-letter doc %s to %s", doc_id, recipient,
+                         extra={"pipeline": pipeline, "doc_id": doc_id, "recipient": recipient})
+
+
+DEAD_LETTER_COLLECTION = 'email_dead_letters'
+
+retries = RetryScheduler(
+    retry_send,
+    retry_succeeded,
+    dead_letter,
+    max_attempts=settings.retry_max_attempts,
+    base_delay=settings.retry_base_delay,
+    max_delay=settings.retry_max_delay,
+)
+
+
+track_queue_depth("retries", lambda: len(retries))
+
+
+async def start_retries():
+    """Reload the failed sends recorded in the outbox and start the retry timer."""
+    # Envios que este processo já está a repetir (ex.: falhas de eventos recebidos antes de ser líder)
+    queued = {outbox_key(item["pipeline"], item["doc_id"], item["recipient"]) for item in retries.items()}
+    for row in await outbox.failed():
+        if outbox_key(row["pipeline"], row["doc_id"], row["recipient"]) in queued:
+            continue
+        retries.schedule(row)
+    if len(retries):
+        logger.info("Scheduled %d failed emails for retry.", len(retries))
+    retries.start()
+
+
+async def replay_outbox():
+    """Finish the documents a previous process left without a Firestore ack."""
+    documents = await outbox.unacked()
+    if documents:
+        logger.info("Replaying %d documents from the outbox.", len(documents))
+    for (pipeline, doc_id), rows in documents.items():
+        try:
+            pending = [row for row in rows if row["status"] == "pending"]
+            results = await asyncio.gather(
+                *(dispatch_email(row["subject"], row["body"], row["recipient"], doc_id) for row in pending),
+                return_exceptions=True)
+            outcomes = {row["recipient"]: result is True for row, result in zip(pending, results)}
+            if outcomes:
+                await outbox.mark_results(pipeline, doc_id, outcomes)
+            success = all(row["status"] == "sent" or outcomes.get(row["recipient"]) for row in rows)
+            await ack(PIPELINES[pipeline], doc_id, success)
+        except Exception:
+            logger.exception("Error replaying document %s from the outbox", doc_id,
+                             extra={"pipeline": pipeline, "doc_id": doc_id})
+    await outbox.purge(settings.outbox_retention_seconds)
+
+
+@single_flight
+async def process(pipeline, doc):
+    """Claim, send and ack one document; a true result means it needs nothing more from this worker."""
+    doc_id = doc["id"]
+    context = {"pipeline": pipeline.name, "doc_id": doc_id}
+    if not pipeline.claims.owns(doc_id):
+        return True
+    logger.info("Processing document %s", doc_id, extra=context)
+
+    recipients = await pipeline.recipients(doc)
+    logger.info("Recipients for document %s: %s", doc_id, recipients, extra={**context, "sampled": True})
+    if not recipients:
+        # Sem destinatários o documento nunca será enviado: não deve prender o checkpoint
+        return True
+
+    doc_ref = pipeline.document(doc_id)
+    try:
+        # Primeiro reclamar o documento para evitar processamento duplicado. Se o worker cair
+        # antes do outbox, o documento continua pendente e volta ao pool quando a lease expirar
+        if not await pipeline.claims.claim(doc_ref, pipeline.is_pending, pipeline.claim_fields()):
+            logger.info("Document %s was claimed by another worker, skipping", doc_id, extra=context)
+            return False
+
+        try:
+            with RENDER_LATENCY.labels(pipeline.name).time():
+                subject, body = pipeline.render(doc)
+        except Exception as e:
+            # Com os mesmos dados o render volta a falhar: erro definitivo
+            logger.exception("Failed to render document %s", doc_id, extra=context)
+            await pipeline.writes.update(doc_ref, pipeline.error_fields(e))
+            return True
+
+        success = await deliver(pipeline.name, doc_id, subject, body, recipients, doc.get(pipeline.created_field))
+        return ack_in_background(pipeline, doc_id, success)
 
-def get_aemc_email_recipients(to):
+    except Exception as e:
+        logger.exception("Error processing document %s", doc_id, extra=context)
+        # Marcar documento com erro
+        await pipeline.writes.update(doc_ref, pipeline.error_fields(e))
+        return False
+
+
+async def check(pipeline):
+    """Poll tick over the pipeline's pending documents; returns the number sent, or None on error."""
+    try:
+        query = pipeline.query(pipeline.client).select(pipeline.projection)
+        processed = await scan_new_documents(
+            pipeline.name, query, pipeline.created_field, functools.partial(process, pipeline), pipeline.checkpoints)
+        if processed:
+            logger.info("Processed %d new documents.", processed, extra={"pipeline": pipeline.name})
+        return processed
+    except Exception:
+        logger.exception("Error while checking documents", extra={"pipeline": pipeline.name})
+        return None
+
+
+async def get_aemc_email_recipients(to):
     if to == 'admin':
-        return fetch_aemc_admin_emails()
+        return await fetch_aemc_admin_emails()
     else:
         return [to]
 
-def fetch_aemc_admin_emails():
-    #on the collection users pick all with role admin, and the id of document is the uid of the user, so pick the email of the user
-    query = dbAemc.collection('users').where('role', '==', 'admin').stream()
-    #for each document in the query, pick the id and find the user on authentification and pick the email
-    emails = []
-    for doc in query:
-        user = authAemc.get_user(doc.id)
-        emails.append(user.email)
-    return emails
+async def fetch_aemc_admin_emails():
+    # Os uids vêm da coleção users (role admin) e os emails do Authentication, em lote e com cache
+    return list(await aemc_admins.get_emails())
 
 
 def parse_aemc_subject(type):
@@ -244,57 +465,137 @@ def parse_aemc_subject(type):
         return 'AEMC'
 
 def generate_email_body(doc_id):
-    # Leia o template HTML
-    dirTemplate = "app/templates/confirmation.template.html"
-    with open(dirTemplate, "r", encoding='utf-8') as file:
-        html_content = file.read()
-
-    # Substitua o marcador {{ id }} pelo ID real do documento
-    html_content = html_content.replace("{{ id }}", doc_id)
-
-    return html_content
+    return templates.render("confirmation", id=doc_id)
 
 def generate_aemc_message_body(subject, name, email, message):
-    dirTemplate = "app/templates/message.template.html"
-    with open(dirTemplate, "r", encoding='utf-8') as file:
-        html_content = file.read()
-    html_content = html_content.replace("aemcSubject", subject)
-    html_content = html_content.replace("aemcName", name)
-    html_content = html_content.replace("aemcEmail", email)
-    html_content = html_content.replace("aemcMessage", message)
-    return html_content
+    return templates.render("message", subject=subject, name=name, email=email, message=message)
 
 def generate_aemc_email_body(type, name, email, password, reason):
     if type == 'request_received':
-        dirTemplate = "app/templates/requestmember.template.html"
-        with open(dirTemplate, "r", encoding='utf-8') as file:
-            html_content = file.read()
-        # Substituir o nome da empresa no template
-        html_content = html_content.replace("AiTECH", name)
-        return html_content
+        return templates.render("requestmember", name=name)
     elif type == 'new_request':
-        dirTemplate = "app/templates/requestadmin.template.html"
-        with open(dirTemplate, "r", encoding='utf-8') as file:
-            html_content = file.read()
-        # Substituir o nome da empresa no template
-        html_content = html_content.replace("AiTECH", name)
-        return html_content
+        return templates.render("requestadmin", name=name)
     elif type == 'request_approved':
-        dirTemplate = "app/templates/responsemember.template.html"
-        with open(dirTemplate, "r", encoding='utf-8') as file:
-            html_content = file.read()
-        # Substituir o nome da empresa no template
-        html_content = html_content.replace("AiTECH", name)
-        html_content = html_content.replace("adminEmail", email)
-        html_content = html_content.replace("adminPassword", password)
-        return html_content
+        return templates.render("responsemember", name=name, email=email, password=password)
     elif type == 'request_rejected':
-        dirTemplate = "app/templates/rejectmember.template.html"
-        with open(dirTemplate, "r", encoding='utf-8') as file:
-            html_content = file.read()
-        # Substituir o nome da empresa no template
-        html_content = html_content.replace("AiTECH", name)
-        html_content = html_content.replace("aemcReason", reason)
-        return html_content
+        return templates.render("rejectmember", name=name, reason=reason)
     else:
-        return 'AEMC'
\ No newline at end of file
+        return 'AEMC'
+
+
+async def registration_recipients(doc):
+    return get_email_recipients(doc)
+
+
+def render_registration(doc):
+    return "Confirmação de Receção de Inscrição", generate_email_body(doc["id"])
+
+
+def render_aemc_message(doc):
+    body = generate_aemc_message_body(doc.get('assunto'), doc.get('nome'), doc.get('email'), doc.get('mensagem'))
+    return "AEMC - Nova Mensagem", body
+
+
+def render_aemc_notification(doc):
+    body = generate_aemc_email_body(doc.get('type'), doc.get('name'), doc.get('adminEmail') or None,
+                                    doc.get('adminPassword') or None, doc.get('reason') or None)
+    return parse_aemc_subject(doc.get('type')), body
+
+
+def aemc_error_fields(error):
+    return {"error_message": str(error)}
+
+
+# Pipelines declarados; o executor comum (process/check), o push e os listeners percorrem este registo
+PIPELINES = {pipeline.name: pipeline for pipeline in (
+    Pipeline(
+        "registrations",
+        client=db_async,
+        sync_client=db,
+        collection=settings.firebase_collection,
+        pending_field='notification',
+        pending_value=[],
+        fields=REGISTRATION_FIELDS,
+        created_field=settings.registration_created_field,
+        recipients=registration_recipients,
+        render=render_registration,
+        # `notification` só é preenchido no ack (ou no erro): até lá o documento continua
+        # pendente e, se o worker cair, volta ao pool quando a lease do claim expirar
+        claim_fields=lambda: {"email_status": "processing"},
+        ack_fields=lambda success: {
+            "notification": [datetime.datetime.utcnow()],
+            "email_status": "completed" if success else "partial_failure",
+            "email_sent_at": datetime.datetime.utcnow(),
+        },
+        error_fields=lambda error: {
+            "notification": [datetime.datetime.utcnow()],
+            "email_status": "failed",
+            "error_message": str(error),
+        },
+        writes=registration_writes,
+        claims=registration_claims,
+        checkpoints=registration_checkpoints,
+        job_id="firebase_check_job",
+        poll_minutes=5,
+    ),
+    Pipeline(
+        "aemc_notifications",
+        client=dbAemcAsync,
+        sync_client=dbAemc,
+        collection='notifications',
+        pending_field='read',
+        pending_value=False,
+        fields=AEMC_NOTIFICATION_FIELDS,
+        created_field=settings.aemc_notification_created_field,
+        recipients=lambda doc: get_aemc_email_recipients(doc.get('to')),
+        render=render_aemc_notification,
+        ack_fields=lambda success: {"read": True},
+        error_fields=aemc_error_fields,
+        writes=aemc_writes,
+        claims=aemc_claims,
+        checkpoints=aemc_checkpoints,
+        job_id="firebase_check_job_aemc",
+        poll_minutes=1,
+    ),
+    Pipeline(
+        "aemc_messages",
+        client=dbAemcAsync,
+        sync_client=dbAemc,
+        collection='messages',
+        pending_field='read',
+        pending_value=False,
+        fields=AEMC_MESSAGE_FIELDS,
+        created_field=settings.aemc_message_created_field,
+        recipients=lambda doc: fetch_aemc_admin_emails(),
+        render=render_aemc_message,
+        ack_fields=lambda success: {"read": True},
+        error_fields=aemc_error_fields,
+        writes=aemc_writes,
+        claims=aemc_claims,
+        checkpoints=aemc_checkpoints,
+        job_id="firebase_check_job_aemc_messages",
+        poll_minutes=1,
+    ),
+)}
+
+
+async def fetch_pushed_document(pipeline, doc_id):
+    """Read a pushed document from Firestore; None if it no longer exists."""
+    pipeline = PIPELINES[pipeline]
+    started = time.perf_counter()
+    snapshot = await pipeline.document(doc_id).get(field_paths=pipeline.projection)
+    QUERY_LATENCY.labels(pipeline.name).observe(time.perf_counter() - started)
+    if not snapshot.exists:
+        return None
+    DOCS_FETCHED.labels(pipeline.name, "push").inc()
+    return {"id": snapshot.id, **snapshot.to_dict()}
+
+
+events = EventQueue(
+    fetch_pushed_document,
+    {name: functools.partial(process, pipeline) for name, pipeline in PIPELINES.items()},
+    concurrency=settings.document_concurrency,
+    max_size=settings.event_queue_size,
+)
+
+track_queue_depth("events", lambda: len(events))
@@ -0,0 +1,74 @@
+import re
+
+# Comentários normais; os condicionais do Outlook (<!--[if mso]>, <!--<![endif]-->) são mantidos
+COMMENT = re.compile(r"<!--(.*?)-->", re.DOTALL)
+STYLE_BLOCK = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.DOTALL | re.IGNORECASE)
+STYLE_ATTRIBUTE = re.compile(r'(\sstyle=")([^"]*)(")', re.IGNORECASE)
+CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_PUNCTUATION = re.compile(r"\s*([{};,])\s*")
+CSS_COLON = re.compile(r":\s+")
+WHITESPACE = re.compile(r"\s+")
+TAG_GAP = re.compile(r">\s+<(/?)([a-zA-Z!][a-zA-Z0-9:]*)")
+TAG_NAME = re.compile(r"<(/?)([a-zA-Z!][a-zA-Z0-9:]*)")
+
+# Elementos de bloco/tabela: o espaço junto a eles não é renderizado
+BLOCK_TAGS = {
+    "!doctype", "html", "head", "title", "meta", "style", "link", "body", "table", "tbody", "thead",
+    "tfoot", "tr", "td", "th", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li",
+    "center", "br", "hr", "xml", "o:officedocumentsettings", "o:allowpng", "o:pixelsperinch",
+    "v:rect", "v:roundrect", "v:textbox", "v:fill", "v:stroke",
+}
+
+
+def _keep_comment(match):
+    content = match.group(1)
+    if content.startswith("[if") or content.startswith("<![endif]") or content.endswith("<![endif]"):
+        return match.group(0)
+    return ""
+
+
+def _minify_css(css):
+    css = CSS_COMMENT.sub("", css)
+    css = WHITESPACE.sub(" ", css)
+    css = CSS_PUNCTUATION.sub(r"\1", css)
+    # Só o espaço depois de ":"; antes dele pode ser um seletor descendente (a :hover)
+    return CSS_COLON.sub(":", css).strip()
+
+
+def _minify_style_attribute(match):
+    return match.group(1) + _minify_css(match.group(2)).rstrip(";") + match.group(3)
+
+
+def _last_tag(html, end):
+    start = html.rfind("<", 0, end)
+    match = TAG_NAME.match(html, start) if start != -1 else None
+    return match.group(2).lower() if match else ""
+
+
+def _collapse_tag_gaps(html):
+    def gap(match):
+        following = match.group(2).lower()
+        previous = _last_tag(html, match.start() + 1)
+        if following in BLOCK_TAGS or previous in BLOCK_TAGS:
+            return "><" + match.group(1) + match.group(2)
+        return "> <" + match.group(1) + match.group(2)
+
+    return TAG_GAP.sub(gap, html)
+
+
+def minify_html(html):
+    """Minify an email template without changing how mail clients render it.
+
+    Drops ordinary comments (keeping Outlook conditional comments), strips
+    CSS comments and the optional whitespace of <style> blocks and inline
+    `style` attributes, removes whitespace next to block and table tags and
+    collapses every other whitespace run to a single space. Text inside the
+    template has no <pre>/<textarea>, so whitespace runs render as one space
+    anyway. Inline styles are kept on their elements: several clients drop
+    <style> blocks, so they cannot be hoisted into classes.
+    """
+    html = COMMENT.sub(_keep_comment, html)
+    html = STYLE_BLOCK.sub(lambda m: m.group(1) + _minify_css(m.group(2)) + m.group(3), html)
+    html = STYLE_ATTRIBUTE.sub(_minify_style_attribute, html)
+    html = WHITESPACE.sub(" ", html)
+    return _collapse_tag_gaps(html).strip()
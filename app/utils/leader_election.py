@@ -0,0 +1,185 @@
+import asyncio
+import datetime
+import logging
+import os
+import socket
+import time
+import uuid
+from google.cloud import firestore
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = 'scheduler_leases'
+
+
+def default_holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderLease:
+    """Firestore-backed lease so only one worker runs the pipelines.
+
+    The lease lives in `scheduler_leases/{name}` with the holder id, its
+    expiry and a token that is incremented each time the lease changes
+    hands, which tells successive leaders apart in the logs. The token is
+    not checked by the pipeline writes: a deposed leader still running a
+    tick is kept from duplicating work by the per-document claims. Every
+    `heartbeat` seconds each worker tries to acquire or renew the lease in
+    a transaction. A worker stops considering itself leader once its own
+    local deadline passes, even if the renewal never came back, and a
+    standby takes over as soon as the lease expires.
+
+    `on_elected` and `on_demoted` run as their own tasks, one at a time, so
+    a slow start (e.g. replaying the outbox) never delays the heartbeat.
+    Losing the lease cancels an `on_elected` still running. If `on_elected`
+    fails, `on_demoted` undoes it and the next heartbeat tries again.
+    `db` is an AsyncClient.
+    """
+
+    def __init__(self, db, name, ttl=10.0, heartbeat=3.0, holder_id=None,
+                 on_elected=None, on_demoted=None):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.holder_id = holder_id or default_holder_id()
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+
+        self.token = None
+        self._elected = False
+        self._deadline = 0.0
+        self._task = None
+        self._transition = None
+
+    @property
+    def doc_ref(self):
+        return self.db.collection(LEASES_COLLECTION).document(self.name)
+
+    @property
+    def is_leader(self):
+        return self.token is not None and time.monotonic() < self._deadline
+
+    async def _try_acquire(self):
+        """Acquire or renew the lease; returns the fencing token or None."""
+        started = time.monotonic()
+        transaction = self.db.transaction()
+
+        @firestore.async_transactional
+        async def acquire(transaction):
+            snapshot = await self.doc_ref.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else {}
+            now = datetime.datetime.now(datetime.timezone.utc)
+            holder = lease.get('holder')
+            expires_at = lease.get('expires_at')
+            if holder not in (None, self.holder_id) and expires_at and expires_at > now:
+                return None
+            token = lease.get('token', 0)
+            if holder != self.holder_id:
+                token += 1
+            transaction.set(self.doc_ref, {
+                'holder': self.holder_id,
+                'expires_at': now + datetime.timedelta(seconds=self.ttl),
+                'token': token,
+            })
+            return token
+
+        token = await acquire(transaction)
+        if token is not None:
+            # Prazo local contado a partir do início do pedido, nunca depois da expiração real
+            self._deadline = started + self.ttl
+        return token
+
+    async def _release(self):
+        transaction = self.db.transaction()
+
+        @firestore.async_transactional
+        async def release(transaction):
+            snapshot = await self.doc_ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.get('holder') == self.holder_id:
+                transaction.update(self.doc_ref, {
+                    'holder': None,
+                    'expires_at': datetime.datetime.now(datetime.timezone.utc),
+                })
+
+        await release(transaction)
+
+    async def _run(self):
+        while True:
+            try:
+                token = await self._try_acquire()
+            except Exception as e:
+                logger.warning("Lease %s heartbeat failed: %s", self.name, e)
+                # Continuar como líder apenas até ao prazo local da última renovação
+                token = self.token if self.is_leader else None
+
+            if token is not None and not self._elected:
+                self.token = token
+                self._elected = True
+                logger.info("Acquired lease %s as %s (token %s)", self.name, self.holder_id, token)
+                self._start_transition(self._elect)
+            elif token is None and self._elected:
+                self._demote()
+            await asyncio.sleep(self.heartbeat)
+
+    def _start_transition(self, step, cancel_previous=False):
+        """Run `step()` once the previous leadership callback has finished."""
+        previous = self._transition
+
+        async def transition():
+            if previous is not None:
+                if cancel_previous:
+                    previous.cancel()
+                await asyncio.gather(previous, return_exceptions=True)
+            await step()
+
+        self._transition = asyncio.get_running_loop().create_task(transition())
+
+    async def _elect(self):
+        if not self.on_elected:
+            return
+        try:
+            await self.on_elected()
+        except Exception:
+            logger.exception("Lease %s: starting as leader failed, retrying on the next heartbeat", self.name)
+            await self._run_demoted()
+            # A lease continua nossa; o próximo heartbeat volta a chamar on_elected
+            self.token = None
+            self._elected = False
+
+    async def _run_demoted(self):
+        if not self.on_demoted:
+            return
+        try:
+            await self.on_demoted()
+        except Exception:
+            logger.exception("Lease %s: stopping as leader failed", self.name)
+
+    def _demote(self):
+        logger.info("Lost lease %s (token %s)", self.name, self.token)
+        self.token = None
+        self._elected = False
+        self._deadline = 0.0
+        # Um on_elected ainda a correr é cancelado antes de parar os pipelines
+        self._start_transition(self._run_demoted, cancel_previous=True)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        elected = self._elected
+        if elected:
+            self._demote()
+        if self._transition is not None:
+            await asyncio.gather(self._transition, return_exceptions=True)
+            self._transition = None
+        if elected:
+            try:
+                # Libertar a lease para que o standby assuma de imediato
+                await self._release()
+            except Exception as e:
+                logger.warning("Failed to release lease %s: %s", self.name, e)
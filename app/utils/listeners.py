@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import threading
+import time
+from app.metrics import DOCS_FETCHED
+
+logger = logging.getLogger(__name__)
+
+# Tipos de alteração que devem ser encaminhados aos handlers
+DISPATCH_CHANGE_TYPES = ("ADDED", "MODIFIED")
+
+
+def field_value(data, path):
+    """Value of a dotted field path (e.g. 'filiation.father.email'), None if missing."""
+    for part in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+class SnapshotListener:
+    """Watch a Firestore query with on_snapshot and dispatch new/changed docs.
+
+    The watch stream callback runs on a Firestore background thread, so
+    each change is handed over to the application event loop, where the
+    async handler runs once per document. A document is only dispatched
+    again when one of its input `fields` changed: the worker's own writes
+    (claim, error message) also fire MODIFIED events, and re-dispatching on
+    those would retry a failing document in a tight loop. Such documents
+    are left to the reconciliation poll. If the stream dies it is reopened
+    by `ensure_alive()`; the documents already dispatched are skipped the
+    same way, so the initial snapshot of a resumed stream does not resend
+    emails.
+    """
+
+    def __init__(self, name, query_factory, handler, fields, max_backoff=300):
+        self.name = name
+        self.query_factory = query_factory
+        self.handler = handler
+        self.fields = list(fields)
+        self.max_backoff = max_backoff
+
+        self._watch = None
+        self._loop = None
+        self._pending = set()
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._failures = 0
+        self._next_attempt = 0.0
+
+    def start(self, loop):
+        self._loop = loop
+        self._stopped = False
+        self._subscribe()
+
+    async def stop(self):
+        self._stopped = True
+        self._unsubscribe()
+        # Aguardar os documentos que já estavam a ser enviados
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    @property
+    def is_active(self):
+        return self._watch is not None and self._watch.is_active
+
+    def ensure_alive(self):
+        """Reopen the watch stream if it terminated, with exponential backoff."""
+        if self._stopped or self.is_active:
+            return
+        if time.monotonic() < self._next_attempt:
+            return
+        logger.warning("Listener %s is not active, reconnecting", self.name, extra={"pipeline": self.name})
+        self._unsubscribe()
+        self._subscribe()
+
+    def _subscribe(self):
+        try:
+            self._watch = self.query_factory().on_snapshot(self._on_snapshot)
+            self._failures = 0
+            self._next_attempt = 0.0
+        except Exception as e:
+            self._watch = None
+            self._failures += 1
+            delay = min(self.max_backoff, 2 ** self._failures)
+            self._next_attempt = time.monotonic() + delay
+            logger.error("Failed to start listener %s, retrying in %ss: %s", self.name, delay, e, extra={"pipeline": self.name})
+
+    def _unsubscribe(self):
+        watch, self._watch = self._watch, None
+        if watch is not None:
+            try:
+                watch.unsubscribe()
+            except Exception as e:
+                logger.warning("Error closing listener %s: %s", self.name, e, extra={"pipeline": self.name})
+
+    def _on_snapshot(self, docs, changes, read_time):
+        # Corre na thread do Firestore: apenas filtrar e passar ao event loop
+        for change in changes:
+            snapshot = change.document
+            if change.type.name not in DISPATCH_CHANGE_TYPES:
+                # O documento saiu da query (ex.: marcado como lido)
+                with self._lock:
+                    self._seen.pop(snapshot.id, None)
+                continue
+            data = snapshot.to_dict() or {}
+            inputs = [field_value(data, field) for field in self.fields]
+            with self._lock:
+                if snapshot.id in self._seen and self._seen[snapshot.id] == inputs:
+                    continue
+                self._seen[snapshot.id] = inputs
+            DOCS_FETCHED.labels(self.name, "listener").inc()
+            doc = {"id": snapshot.id, **data}
+            self._loop.call_soon_threadsafe(self._dispatch, doc)
+
+    def _dispatch(self, doc):
+        task = self._loop.create_task(self._handle(doc))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _handle(self, doc):
+        try:
+            await self.handler(doc)
+        except Exception:
+            logger.exception("Listener %s failed to handle document %s", self.name, doc["id"],
+                             extra={"pipeline": self.name, "doc_id": doc["id"]})
+            # Permitir nova tentativa numa próxima entrega do documento
+            with self._lock:
+                self._seen.pop(doc["id"], None)
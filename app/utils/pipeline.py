@@ -0,0 +1,62 @@
+class Pipeline:
+    """Declaration of one notification pipeline.
+
+    A pipeline watches the documents of `collection` whose `pending_field`
+    equals `pending_value`, reads only `fields` (plus `created_field`),
+    resolves the recipients and renders the email of each document, and
+    writes `ack_fields` back once it has been sent. The shared executor in
+    `app.utils.firebase_utils` runs every pipeline the same way; the
+    callables below are the only per-pipeline code:
+
+    - `recipients(doc)`: coroutine returning the list of addresses;
+    - `render(doc)`: returns (subject, body);
+    - `claim_fields()`: extra fields written by the claim transaction;
+    - `ack_fields(success)`: fields written once the emails went out;
+    - `error_fields(error)`: fields written when the document failed.
+
+    `client` is the AsyncClient used for polling and writes and
+    `sync_client` the client used for the watch stream. `writes`,
+    `claims` and `checkpoints` are the WriteBuffer, DocumentClaimer and
+    CheckpointStore of that database, shared between its pipelines.
+    """
+
+    def __init__(self, name, *, client, sync_client, collection, pending_field, pending_value,
+                 fields, created_field, recipients, render, ack_fields, error_fields,
+                 writes, claims, checkpoints, job_id, poll_minutes, claim_fields=None):
+        self.name = name
+        self.client = client
+        self.sync_client = sync_client
+        self.collection = collection
+        self.pending_field = pending_field
+        self.pending_value = pending_value
+        self.fields = list(fields)
+        self.created_field = created_field
+        self.recipients = recipients
+        self.render = render
+        self.ack_fields = ack_fields
+        self.error_fields = error_fields
+        self.claim_fields = claim_fields or dict
+        self.writes = writes
+        self.claims = claims
+        self.checkpoints = checkpoints
+        self.job_id = job_id
+        self.poll_minutes = poll_minutes
+
+    def __repr__(self):
+        return f"Pipeline({self.name!r})"
+
+    @property
+    def projection(self):
+        return self.fields + [self.created_field]
+
+    def query(self, client=None):
+        """Documents still pending; the sync client by default, for on_snapshot."""
+        client = client or self.sync_client
+        return client.collection(self.collection).where(self.pending_field, '==', self.pending_value)
+
+    def document(self, doc_id):
+        return self.client.collection(self.collection).document(doc_id)
+
+    def is_pending(self, data):
+        # Mesma condição da query, reavaliada dentro da transação do claim
+        return data.get(self.pending_field) == self.pending_value
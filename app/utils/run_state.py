@@ -0,0 +1,90 @@
+import datetime
+import functools
+import logging
+import time
+from app.metrics import TICK_DURATION, TICK_OVERRUNS, TICK_RUNNING, TICKS_COALESCED
+
+logger = logging.getLogger(__name__)
+
+
+class RunState:
+    """Run-state of one pipeline job: one sweep at a time, late ticks coalesced.
+
+    A tick that fires while the previous sweep is still running does not
+    start a second sweep on the same documents; it only marks the job as
+    pending and returns. When the running sweep finishes it runs exactly
+    once more if any tick was coalesced, however many fired meanwhile, so a
+    long sweep carries on into the next window instead of piling up runs.
+    A sweep longer than `interval()` seconds counts as an overrun.
+    """
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+
+        self.running = False
+        self.pending = False
+        self.started_at = None
+        self.finished_at = None
+        self.last_duration = None
+        self.last_result = None
+        self.runs = 0
+        self.overruns = 0
+        self.coalesced = 0
+
+    def snapshot(self):
+        return {
+            "job_id": self.job_id,
+            "running": self.running,
+            "pending": self.pending,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_duration": self.last_duration,
+            "last_result": self.last_result,
+            "interval": self.interval(),
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "coalesced": self.coalesced,
+        }
+
+    def guard(self, tick):
+        @functools.wraps(tick)
+        async def wrapper(*args):
+            if self.running:
+                self.pending = True
+                self.coalesced += 1
+                TICKS_COALESCED.labels(self.job_id).inc()
+                logger.info("Job %s is still running, coalescing this tick", self.job_id)
+                return None
+
+            self.running = True
+            TICK_RUNNING.labels(self.job_id).set(1)
+            try:
+                while True:
+                    self.pending = False
+                    result = await self._run(tick, args)
+                    if not self.pending:
+                        return result
+                    # Ticks que chegaram durante a varredura: uma única repetição
+            finally:
+                self.running = False
+                TICK_RUNNING.labels(self.job_id).set(0)
+        return wrapper
+
+    async def _run(self, tick, args):
+        interval = self.interval()
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        started = time.perf_counter()
+        try:
+            self.last_result = await tick(*args)
+            return self.last_result
+        finally:
+            self.last_duration = time.perf_counter() - started
+            self.finished_at = datetime.datetime.now(datetime.timezone.utc)
+            self.runs += 1
+            TICK_DURATION.labels(self.job_id).observe(self.last_duration)
+            if self.last_duration > interval:
+                self.overruns += 1
+                TICK_OVERRUNS.labels(self.job_id).inc()
+                logger.warning("Job %s took %.1fs, longer than its %.1fs interval",
+                               self.job_id, self.last_duration, interval)
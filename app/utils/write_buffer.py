@@ -0,0 +1,95 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Limite de operações por batched write do Firestore
+MAX_BATCH_SIZE = 500
+
+
+class WriteBuffer:
+    """Coalesce document updates into Firestore batched writes.
+
+    `update()` queues the write and waits until it is committed. Pending
+    writes are flushed once `max_batch` are queued or `flush_interval`
+    seconds after the first one, whichever comes first; updates to the same
+    document inside one flush are merged. If a batch commit fails the
+    writes are retried one by one so each caller gets its own result.
+    `client` is an AsyncClient and the document references must come from it.
+    """
+
+    def __init__(self, client, max_batch=MAX_BATCH_SIZE, flush_interval=0.5):
+        self.client = client
+        self.max_batch = min(max_batch, MAX_BATCH_SIZE)
+        self.flush_interval = flush_interval
+
+        self._pending = {}
+        self._timer = None
+        self._flushing = set()
+
+    async def update(self, doc_ref, data):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = self._pending.get(doc_ref.path)
+        if entry is None:
+            self._pending[doc_ref.path] = (doc_ref, dict(data), [future])
+        else:
+            entry[1].update(data)
+            entry[2].append(future)
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._start_flush)
+        await future
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        entries, self._pending = list(self._pending.values()), {}
+        task = asyncio.get_running_loop().create_task(self._flush(entries))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, entries):
+        try:
+            errors = await self._commit(entries)
+        except Exception as e:
+            errors = [e] * len(entries)
+        for (doc_ref, _, futures), error in zip(entries, errors):
+            if error is not None:
+                logger.error("Failed to update document %s: %s", doc_ref.id, error, extra={"doc_id": doc_ref.id})
+            for future in futures:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    async def _commit(self, entries):
+        batch = self.client.batch()
+        for doc_ref, data, _ in entries:
+            batch.update(doc_ref, data)
+        try:
+            await batch.commit()
+            return [None] * len(entries)
+        except Exception as e:
+            logger.warning("Batched write of %d documents failed, retrying individually: %s", len(entries), e)
+
+        errors = []
+        for doc_ref, data, _ in entries:
+            try:
+                await doc_ref.update(data)
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    async def close(self):
+        self._start_flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
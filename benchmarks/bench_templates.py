@@ -0,0 +1,60 @@
+"""Per-render cost of the email templates: legacy open()+replace vs the registry.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_templates
+"""
+import timeit
+
+from app.template_registry import TEMPLATES_DIR, templates
+from app.utils.html_minify import minify_html
+
+RENDERS = 2000
+
+
+def legacy_response_member(name, email, password):
+    with open(f"{TEMPLATES_DIR}/responsemember.template.html", "r", encoding='utf-8') as file:
+        html_content = file.read()
+    html_content = html_content.replace("AiTECH", name)
+    html_content = html_content.replace("adminEmail", email)
+    html_content = html_content.replace("adminPassword", password)
+    return html_content
+
+
+def legacy_message(subject, name, email, message):
+    with open(f"{TEMPLATES_DIR}/message.template.html", "r", encoding='utf-8') as file:
+        html_content = file.read()
+    html_content = html_content.replace("aemcSubject", subject)
+    html_content = html_content.replace("aemcName", name)
+    html_content = html_content.replace("aemcEmail", email)
+    html_content = html_content.replace("aemcMessage", message)
+    return html_content
+
+
+CASES = {
+    "responsemember": (
+        lambda: legacy_response_member("Empresa", "admin@example.com", "secret"),
+        lambda: templates.render("responsemember", name="Empresa", email="admin@example.com", password="secret"),
+    ),
+    "message": (
+        lambda: legacy_message("Assunto", "Nome", "a@example.com", "Mensagem"),
+        lambda: templates.render("message", subject="Assunto", name="Nome", email="a@example.com", message="Mensagem"),
+    ),
+}
+
+
+def main():
+    templates.load_all()
+    for name, (legacy, compiled) in CASES.items():
+        # O registo minifica os templates ao carregar
+        assert minify_html(legacy()) == compiled(), f"{name}: compiled output differs from legacy output"
+        legacy_us = min(timeit.repeat(legacy, number=RENDERS, repeat=3)) / RENDERS * 1e6
+        compiled_us = min(timeit.repeat(compiled, number=RENDERS, repeat=3)) / RENDERS * 1e6
+        print(f"{name:16} legacy {legacy_us:8.1f} us/render   compiled {compiled_us:8.1f} us/render   "
+              f"x{legacy_us / compiled_us:.1f}")
+    for name, (source_size, size) in templates.sizes().items():
+        print(f"{name:16} {source_size:8d} bytes -> {size:8d} bytes minified")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""In-process stand-in for the Firestore/Auth clients used by the pipelines.
+
+Only the subset of the AsyncClient API that `app.utils.firebase_utils` and
+its helpers call is implemented: collections and documents, equality
+`where`, `select`, `order_by`, `limit`, `start_after`, `stream`, document
+`get`/`set`/`update`, batched writes and transactions. Every RPC can be
+given an artificial `latency` (seconds) to model the network round trip.
+"""
+import asyncio
+import copy
+import datetime
+import functools
+
+DOCUMENT_ID = '__name__'
+
+
+def _get_path(data, path):
+    value = data
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _project(data, fields):
+    projected = {}
+    for path in fields:
+        value = _get_path(data, path)
+        if value is None:
+            continue
+        target = projected
+        parts = path.split('.')
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(value)
+    return projected
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path):
+        return _get_path(self._data or {}, field_path)
+
+
+class FakeDocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    async def get(self, transaction=None, field_paths=None):
+        await self._client.rpc()
+        data = self._client.read(self._collection, self.id)
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return FakeSnapshot(self, data, self._client.update_times.get(self.path))
+
+    async def set(self, data, merge=False):
+        await self._client.rpc()
+        self._client.write(self._collection, self.id, data, create=True, merge=merge)
+
+    async def update(self, data):
+        await self._client.rpc()
+        self._client.write(self._collection, self.id, data)
+
+
+class FakeQuery:
+    def __init__(self, client, collection, filters=(), fields=None, orders=(), limit=None, cursor=None):
+        self._client = client
+        self._collection = collection
+        self._filters = filters
+        self._fields = fields
+        self._orders = orders
+        self._limit = limit
+        self._cursor = cursor
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "fields": self._fields, "orders": self._orders,
+            "limit": self._limit, "cursor": self._cursor,
+        }
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field_path, op_string, value):
+        if op_string != '==':
+            raise NotImplementedError(f"Unsupported operator {op_string}")
+        return self._copy(filters=self._filters + ((field_path, value),))
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path):
+        return self._copy(orders=self._orders + (field_path,))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, values):
+        return self._copy(cursor=values)
+
+    def _sort_key(self, doc_id, data):
+        return tuple(doc_id if field == DOCUMENT_ID else _get_path(data, field) for field in self._orders)
+
+    def _matches(self):
+        documents = self._client.collections.get(self._collection, {})
+        rows = [
+            (doc_id, data) for doc_id, data in documents.items()
+            if all(_get_path(data, field) == value for field, value in self._filters)
+        ]
+        if self._orders:
+            rows.sort(key=lambda row: self._sort_key(*row))
+            if self._cursor is not None:
+                cursor = tuple(self._cursor[field] for field in self._orders)
+                rows = [row for row in rows if self._sort_key(*row) > cursor]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        return rows
+
+    async def stream(self):
+        await self._client.rpc()
+        for doc_id, data in self._matches():
+            data = _project(data, self._fields) if self._fields is not None else copy.deepcopy(data)
+            reference = FakeDocumentReference(self._client, self._collection, doc_id)
+            yield FakeSnapshot(reference, data, self._client.update_times.get(reference.path))
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, collection):
+        super().__init__(client, collection)
+
+    def document(self, doc_id):
+        return FakeDocumentReference(self._client, self._collection, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def update(self, reference, data):
+        self._writes.append((reference, data, False))
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, True))
+
+    async def commit(self):
+        await self._client.rpc()
+        for reference, data, create in self._writes:
+            self._client.write(reference._collection, reference.id, data, create=create)
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    pass
+
+
+class FakeFirestore:
+    """Dict-backed Firestore database shared by the sync and async handles.
+
+    `on_write(path, data, when)` is called after every write with the
+    merged document, so a harness can timestamp acks without polling.
+    """
+
+    def __init__(self, latency=0.0, on_write=None):
+        self.latency = latency
+        self.on_write = on_write
+        self.collections = {}
+        self.update_times = {}
+        self.rpcs = 0
+        self._transaction_lock = None
+
+    async def rpc(self):
+        self.rpcs += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def read(self, collection, doc_id):
+        return self.collections.get(collection, {}).get(doc_id)
+
+    def write(self, collection, doc_id, data, create=False, merge=False):
+        documents = self.collections.setdefault(collection, {})
+        if doc_id not in documents and not create:
+            raise KeyError(f"No document to update: {collection}/{doc_id}")
+        if create and not merge:
+            documents[doc_id] = copy.deepcopy(data)
+        else:
+            documents.setdefault(doc_id, {}).update(copy.deepcopy(data))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.update_times[f"{collection}/{doc_id}"] = now
+        if self.on_write is not None:
+            self.on_write(collection, doc_id, documents[doc_id], now)
+
+    def seed(self, collection, documents):
+        """Insert {doc_id: data} without going through the RPC path."""
+        self.collections.setdefault(collection, {}).update(documents)
+
+    @property
+    def transaction_lock(self):
+        if self._transaction_lock is None:
+            self._transaction_lock = asyncio.Lock()
+        return self._transaction_lock
+
+
+def async_transactional(function):
+    """Replacement for `firestore.async_transactional` over FakeTransaction.
+
+    Transactions on one FakeFirestore are serialised by a lock, so the
+    read-check-write in the claim behaves like the real optimistic
+    transaction without retries.
+    """
+    @functools.wraps(function)
+    async def run(transaction, *args, **kwargs):
+        async with transaction._client.transaction_lock:
+            result = await function(transaction, *args, **kwargs)
+            await transaction.commit()
+        return result
+    return run
+
+
+def patch_transactions():
+    """Point google.cloud.firestore.async_transactional at the fake one."""
+    from google.cloud import firestore
+    firestore.async_transactional = async_transactional
+
+
+class FakeUser:
+    def __init__(self, uid, email):
+        self.uid = uid
+        self.email = email
+
+
+class FakeGetUsersResult:
+    def __init__(self, users):
+        self.users = users
+
+
+class FakeAuth:
+    """Auth client answering `get_users` from a {uid: email} dict."""
+
+    def __init__(self, emails=None):
+        self.emails = dict(emails or {})
+
+    def get_users(self, identifiers):
+        return FakeGetUsersResult([
+            FakeUser(identifier.uid, self.emails[identifier.uid])
+            for identifier in identifiers if identifier.uid in self.emails
+        ])
@@ -0,0 +1,252 @@
+"""End-to-end load test of the notification pipelines, fully offline.
+
+Seeds N pending documents into an in-memory Firestore (see
+benchmarks.fake_firestore), points the SMTP pool at a local sink (see
+benchmarks.smtp_sink) and runs the real poll path: query, claim, render,
+outbox, SMTP, ack. For each pipeline it reports docs/s, emails/s, the
+p50/p99 latency from a document's createdAt to its ack, and the peak RSS.
+Each pipeline runs in its own process so the RSS figures are separate.
+
+Requires the packages in requirements-dev.txt (the application
+dependencies plus aiosmtpd). Run from the repository root:
+
+    pip install -r requirements-dev.txt
+    python -m benchmarks.load_test --docs 2000
+    python -m benchmarks.load_test --pipeline aemc_messages --smtp-latency 0.05 --smtp-failure-rate 0.02
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+PIPELINE_NAMES = ("registrations", "aemc_notifications", "aemc_messages")
+REGISTRATIONS_COLLECTION = "registrations"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def configure_environment(args, sink, workdir):
+    """Settings for a local run; variables already set in the shell win."""
+    defaults = {
+        "SMTP_HOST": sink.hostname,
+        "SMTP_PORT": str(sink.port),
+        "SMTP_USER": "load-test@example.com",
+        "SMTP_PASSWORD": "load-test",
+        "SMTP_START_TLS": "false",
+        # Sem limite de débito por omissão, para medir o pipeline e não o token bucket
+        "SMTP_RATE_PER_SECOND": "1000000",
+        "SMTP_RATE_BURST": "1000000",
+        "FIREBASE_COLLECTION": REGISTRATIONS_COLLECTION,
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "INGESTION_MODE": "poll",
+        "LEADER_ELECTION_ENABLED": "false",
+        "WORKER_ID": "load-test",
+        "RETRY_BASE_DELAY": "0.05",
+        "RETRY_MAX_DELAY": "1.0",
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def seed(pipeline_name, args, databases, auth, created_at):
+    """Insert the pending documents of one pipeline; returns {doc_id: createdAt}."""
+    doc_ids = [f"doc{index:07d}" for index in range(args.docs)]
+    if pipeline_name == "registrations":
+        databases["default"].seed(REGISTRATIONS_COLLECTION, {
+            doc_id: {
+                "notification": [],
+                "educationGuardian": "parents",
+                "filiation": {
+                    "father": {"email": f"father-{doc_id}@guardian.test"},
+                    "mother": {"email": f"mother-{doc_id}@guardian.test"},
+                },
+                "createdAt": created_at,
+            }
+            for doc_id in doc_ids
+        })
+    elif pipeline_name == "aemc_notifications":
+        databases["aemc"].seed("notifications", {
+            doc_id: {
+                "read": False,
+                "type": "request_received",
+                "name": f"Membro {doc_id}",
+                "to": f"{doc_id}@member.test",
+                "createdAt": created_at,
+            }
+            for doc_id in doc_ids
+        })
+    else:
+        databases["aemc"].seed("users", {f"admin{index}": {"role": "admin"} for index in range(args.admins)})
+        auth.emails.update({f"admin{index}": f"admin{index}@aemc.test" for index in range(args.admins)})
+        databases["aemc"].seed("messages", {
+            doc_id: {
+                "read": False,
+                "assunto": f"Assunto {doc_id}",
+                "nome": "Remetente",
+                "email": "remetente@example.com",
+                "mensagem": f"Mensagem {doc_id}",
+                "createdAt": created_at,
+            }
+            for doc_id in doc_ids
+        })
+    return dict.fromkeys(doc_ids, created_at)
+
+
+def has_timestamp(value):
+    if isinstance(value, list):
+        return any(has_timestamp(item) for item in value)
+    return isinstance(value, datetime.datetime)
+
+
+def is_acked(pipeline, doc):
+    # Ack com sucesso: os campos de ack_fields(True), exceto timestamps, já estão no documento
+    for field, value in pipeline.ack_fields(True).items():
+        if field not in doc:
+            return False
+        if not has_timestamp(value) and doc[field] != value:
+            return False
+    return True
+
+
+async def run_pipeline(pipeline_name, args, sink):
+    from benchmarks.fake_firestore import FakeAuth, FakeFirestore, patch_transactions
+    from app.tenants import tenants
+
+    acked = {}
+    pipeline = None
+
+    def on_write(collection, doc_id, doc, when):
+        if pipeline is not None and collection == pipeline.collection and doc_id not in acked:
+            if is_acked(pipeline, doc):
+                acked[doc_id] = when
+
+    databases = {
+        "default": FakeFirestore(args.firestore_latency, on_write),
+        "aemc": FakeFirestore(args.firestore_latency, on_write),
+    }
+    auth = FakeAuth()
+    tenants["default"].use_clients(db=databases["default"], db_async=databases["default"])
+    tenants["aemc"].use_clients(db=databases["aemc"], db_async=databases["aemc"], auth=auth)
+    patch_transactions()
+
+    from app.smtp_service import close_email_dispatcher, close_smtp_pool
+    from app.template_registry import templates
+    from app.utils import firebase_utils
+
+    pipeline = firebase_utils.PIPELINES[pipeline_name]
+    templates.load_all()
+    await firebase_utils.outbox.open()
+    await firebase_utils.start_retries()
+
+    created = seed(pipeline_name, args, databases, auth, datetime.datetime.now(datetime.timezone.utc))
+    started = time.perf_counter()
+    deadline = time.monotonic() + args.timeout
+    while len(acked) < len(created) and time.monotonic() < deadline:
+        await firebase_utils.check(pipeline)
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await firebase_utils.retries.stop()
+    await firebase_utils.drain_acks()
+    await firebase_utils.registration_writes.close()
+    await firebase_utils.aemc_writes.close()
+    await close_email_dispatcher()
+    await close_smtp_pool()
+    await firebase_utils.outbox.close()
+
+    latencies = [(acked[doc_id] - created[doc_id]).total_seconds() for doc_id in acked]
+    return {
+        "pipeline": pipeline_name,
+        "docs": len(created),
+        "completed": len(acked),
+        "seconds": elapsed,
+        "docs_per_second": len(acked) / elapsed,
+        "emails": sink.handler.received,
+        "emails_per_second": sink.handler.received / elapsed,
+        "rejected": sink.handler.rejected,
+        "p50_latency": percentile(latencies, 0.50),
+        "p99_latency": percentile(latencies, 0.99),
+        "firestore_rpcs": databases["default"].rpcs + databases["aemc"].rpcs,
+        # ru_maxrss vem em KiB no Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_single(args):
+    from benchmarks.smtp_sink import SMTPSink
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    # O aiosmtpd avisa de uma API obsoleta a cada login
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as workdir, SMTPSink(args.smtp_latency, args.smtp_failure_rate) as sink:
+        configure_environment(args, sink, workdir)
+        return asyncio.run(run_pipeline(args.pipeline, args, sink))
+
+
+def child_command(args, pipeline_name):
+    return [
+        sys.executable, "-m", "benchmarks.load_test",
+        "--pipeline", pipeline_name,
+        "--docs", str(args.docs),
+        "--admins", str(args.admins),
+        "--smtp-latency", str(args.smtp_latency),
+        "--smtp-failure-rate", str(args.smtp_failure_rate),
+        "--firestore-latency", str(args.firestore_latency),
+        "--timeout", str(args.timeout),
+        "--json",
+    ]
+
+
+def format_seconds(value):
+    return f"{value * 1000:9.1f} ms" if value is not None else "        n/a"
+
+
+def print_report(results):
+    print(f"{'pipeline':20} {'done':>11} {'docs/s':>9} {'emails/s':>9} {'p50':>12} {'p99':>12} {'peak RSS':>10}")
+    for result in results:
+        print(f"{result['pipeline']:20} {result['completed']:5d}/{result['docs']:<5d} "
+              f"{result['docs_per_second']:9.1f} {result['emails_per_second']:9.1f} "
+              f"{format_seconds(result['p50_latency'])} {format_seconds(result['p99_latency'])} "
+              f"{result['peak_rss_mb']:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipeline", choices=PIPELINE_NAMES, help="run only this pipeline, in this process")
+    parser.add_argument("--docs", type=int, default=2000, help="pending documents to seed")
+    parser.add_argument("--admins", type=int, default=10, help="AEMC admins receiving each message")
+    parser.add_argument("--smtp-latency", type=float, default=0.0, help="seconds the sink waits per message")
+    parser.add_argument("--smtp-failure-rate", type=float, default=0.0, help="fraction of messages rejected with 451")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="seconds added to every Firestore RPC")
+    parser.add_argument("--timeout", type=float, default=300.0, help="give up after this many seconds")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    if args.pipeline:
+        results = [run_single(args)]
+    else:
+        results = []
+        for pipeline_name in PIPELINE_NAMES:
+            output = subprocess.run(child_command(args, pipeline_name), check=True, stdout=subprocess.PIPE, text=True)
+            results.extend(json.loads(output.stdout))
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Local SMTP server that accepts and discards mail, for load tests.
+
+Requires aiosmtpd, pinned in requirements-dev.txt. The server runs on its own
+thread and event loop. Each message can be delayed by `latency` seconds
+and rejected with a transient 451 with probability `failure_rate`, which
+exercises the pool's reconnect path and the retry scheduler.
+"""
+import asyncio
+import random
+import socket
+import threading
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+class SinkHandler:
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.received = 0
+        self.rejected = 0
+        self.bytes_received = 0
+        self.first_at = None
+        self.last_at = None
+        self._lock = threading.Lock()
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        with self._lock:
+            if self.failure_rate and random.random() < self.failure_rate:
+                self.rejected += 1
+                return "451 4.3.0 Injected transient failure"
+            now = time.monotonic()
+            self.received += len(envelope.rcpt_tos)
+            self.bytes_received += len(envelope.content)
+            self.first_at = self.first_at or now
+            self.last_at = now
+        return "250 Message accepted for delivery"
+
+
+class SMTPSink:
+    """Start/stop wrapper around an aiosmtpd Controller on 127.0.0.1."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, port=None):
+        self.handler = SinkHandler(latency, failure_rate)
+        self.hostname = "127.0.0.1"
+        self.port = port or free_port()
+        self._controller = Controller(
+            self.handler,
+            hostname=self.hostname,
+            port=self.port,
+            authenticator=accept_any_login,
+            auth_require_tls=False,
+        )
+
+    def start(self):
+        self._controller.start()
+
+    def stop(self):
+        self._controller.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,32 @@
+"""Gunicorn settings for running the app with several workers.
+
+Only the worker holding the scheduler lease runs the pipelines, and a
+scrape of /metrics through the shared port reaches any worker. So that
+every scrape sees the whole app, each worker writes its samples to
+PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them (see app.metrics).
+Point the variable at a writable directory used only for this:
+
+    PROMETHEUS_MULTIPROC_DIR=/var/run/nilia-metrics gunicorn app.main:app -w 4
+
+Without it each worker only reports its own counters.
+"""
+import glob
+import os
+from prometheus_client import multiprocess
+
+worker_class = "uvicorn.workers.UvicornWorker"
+
+
+def on_starting(server):
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Amostras de uma execução anterior somar-se-iam às novas
+        os.makedirs(path, exist_ok=True)
+        for stale in glob.glob(os.path.join(path, "*.db")):
+            os.remove(stale)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # Os gauges "live" deixam de contar com o worker que terminou
+        multiprocess.mark_process_dead(worker.pid)